@@ -0,0 +1,4 @@
+# Load .env before any submodule reads its os.getenv() settings.
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -0,0 +1,113 @@
+import os, json, time, hashlib, sqlite3, threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from . import trace
+
+CACHE_DB      = os.getenv("CACHE_DB", "data/cache/http.sqlite")
+CACHE_TTL     = int(os.getenv("CACHE_TTL", str(24 * 3600)))          # fresh: served without revalidation
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", str(30 * 24 * 3600)))  # hard expiry
+CACHE_MAX_MB  = int(os.getenv("CACHE_MAX_MB", "512"))                 # LRU size cap
+
+_local = threading.local()
+_puts = 0
+_EVICT_EVERY = 50
+
+# ----- Keys -----
+def normalize_url(url):
+    s = urlsplit(url.strip())
+    scheme = s.scheme.lower()
+    host = (s.hostname or "").lower()
+    if s.port and not ((scheme == "http" and s.port == 80) or (scheme == "https" and s.port == 443)):
+        host = f"{host}:{s.port}"
+    query = urlencode(sorted(parse_qsl(s.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, s.path or "/", query, ""))
+
+def normalize_query(q):
+    return " ".join(q.split()).lower()
+
+def cache_key(kind, source):
+    return hashlib.sha256(f"{kind}\0{source}".encode("utf-8")).hexdigest()
+
+# ----- Storage -----
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(CACHE_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, kind TEXT, source TEXT, value TEXT,
+            etag TEXT, last_modified TEXT, size INTEGER,
+            stored REAL, accessed REAL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def get(kind, source):
+    """Return the cached row as a dict (fresh or stale), or None."""
+    key = cache_key(kind, source)
+    conn = _db()
+    row = conn.execute("SELECT * FROM entries WHERE key=?", (key,)).fetchone()
+    trace.count("cache_lookups", kind=kind, hit="1" if row is not None else "0")
+    if row is None:
+        return None
+    if time.time() - row["stored"] > CACHE_MAX_AGE:
+        conn.execute("DELETE FROM entries WHERE key=?", (key,))
+        conn.commit()
+        return None
+    conn.execute("UPDATE entries SET accessed=? WHERE key=?", (time.time(), key))
+    conn.commit()
+    return dict(row)
+
+def is_fresh(row, ttl=CACHE_TTL):
+    return row is not None and time.time() - row["stored"] <= ttl
+
+def put(kind, source, value, etag=None, last_modified=None):
+    global _puts
+    now = time.time()
+    conn = _db()
+    conn.execute("INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?,?,?)", (
+        cache_key(kind, source), kind, source, value, etag, last_modified,
+        len(value.encode("utf-8")), now, now))
+    conn.commit()
+    _puts += 1
+    if _puts % _EVICT_EVERY == 0:
+        evict()
+
+def revalidated(kind, source):
+    """Mark a stale entry fresh again after a 304 Not Modified."""
+    conn = _db()
+    conn.execute("UPDATE entries SET stored=?, accessed=? WHERE key=?",
+                 (time.time(), time.time(), cache_key(kind, source)))
+    conn.commit()
+
+def get_json(kind, source, ttl=CACHE_TTL):
+    row = get(kind, source)
+    return json.loads(row["value"]) if is_fresh(row, ttl) else None
+
+def put_json(kind, source, obj):
+    put(kind, source, json.dumps(obj, ensure_ascii=False))
+
+def rows(kind):
+    """(source, value) of every live entry of `kind`, without touching access times."""
+    cutoff = time.time() - CACHE_MAX_AGE
+    for row in _db().execute("SELECT source, value FROM entries WHERE kind=? AND stored >= ?", (kind, cutoff)).fetchall():
+        yield row["source"], row["value"]
+
+def evict(max_bytes=None):
+    """Drop hard-expired entries, then least-recently-used ones until under the size cap."""
+    max_bytes = CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    conn = _db()
+    conn.execute("DELETE FROM entries WHERE stored < ?", (time.time() - CACHE_MAX_AGE,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total > max_bytes:
+        drop, keys = total - max_bytes, []
+        for row in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            keys.append((row["key"],))
+            drop -= row["size"]
+            if drop <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE key=?", keys)
+    conn.commit()
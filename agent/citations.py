@@ -0,0 +1,130 @@
+import os, re, json, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import cache, transport
+
+VERIFY_TTL       = int(os.getenv("VERIFY_TTL", str(7 * 24 * 3600)))   # definitive verdicts: 2xx/3xx, 404, 410
+VERIFY_RETRY_TTL = int(os.getenv("VERIFY_RETRY_TTL", "600"))         # anything else (429, 5xx, timeouts...)
+VERIFY_IN_FLIGHT = int(os.getenv("VERIFY_IN_FLIGHT", "32"))
+VERIFY_PER_HOST  = int(os.getenv("VERIFY_PER_HOST", "4"))
+VERIFY_TIMEOUT   = float(os.getenv("VERIFY_TIMEOUT", "20"))
+
+_URL = re.compile(r"https?://[^\s<>()\[\]{}\"'`]+")
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s<>()\[\]{}\"'`]+)")
+_TRAILING = ".,;:!?*_"
+
+# ----- Extraction -----
+def extract_refs(text):
+    """Every URL and bare DOI in `text` (DOIs as https://doi.org/...), in order of first appearance."""
+    refs, spans = [], []
+    for m in _URL.finditer(text or ""):
+        url = m.group(0).rstrip(_TRAILING)
+        spans.append((m.start(), m.start() + len(url)))
+        refs.append(url)
+    for m in _DOI.finditer(text or ""):
+        if any(a <= m.start() < b for a, b in spans):
+            continue   # already part of a URL (e.g. https://doi.org/10...)
+        refs.append("https://doi.org/" + m.group(1).rstrip(_TRAILING))
+    seen, out = set(), []
+    for r in refs:
+        if r not in seen:
+            seen.add(r)
+            out.append(r)
+    return out
+
+# ----- Checking (HEAD, falling back to a ranged GET; verdicts cached with a TTL) -----
+_pool = None
+_hosts = transport.HostLimiter(VERIFY_PER_HOST)
+_inflight = {}
+_lock = threading.Lock()
+
+def _check(url):
+    with _hosts.slot(url):
+        status, final = None, url
+        try:
+            r = transport.head(url, allow_redirects=True, read_timeout=VERIFY_TIMEOUT)
+            status, final = r.status_code, r.url
+        except Exception:
+            pass
+        # Many servers reject or mishandle HEAD; ask for one byte instead.
+        if status is None or status in (400, 403, 405, 501) or status >= 500:
+            try:
+                with transport.get(url, headers={"Range": "bytes=0-0"}, stream=True,
+                                   allow_redirects=True, read_timeout=VERIFY_TIMEOUT) as r:
+                    status, final = r.status_code, r.url
+            except Exception as e:
+                status, final = None, url
+                error = str(e)
+    verdict = {"ok": status is not None and 200 <= status < 400, "status": status, "url": final}
+    if status is None:
+        verdict["error"] = error
+    cache.put_json("verdict", cache.normalize_url(url), verdict)
+    return verdict
+
+def _definitive(status):
+    return status is not None and (200 <= status < 400 or status in (404, 410))
+
+def _cached(url):
+    """A stored verdict that is still valid: a week for definitive answers, minutes for the rest."""
+    row = cache.get("verdict", cache.normalize_url(url))
+    if row is None:
+        return None
+    verdict = json.loads(row["value"])
+    return verdict if cache.is_fresh(row, VERIFY_TTL if _definitive(verdict.get("status")) else VERIFY_RETRY_TTL) else None
+
+def check_urls(urls):
+    """Start checks for `urls` concurrently; returns {url: Future of verdict}. Repeat URLs share one check."""
+    global _pool
+    futs, started = {}, []
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=VERIFY_IN_FLIGHT, thread_name_prefix="verify")
+        for url in urls:
+            if url not in _inflight:
+                hit = _cached(url)
+                if hit is not None:
+                    fut = Future()
+                    fut.set_result(hit)
+                    futs[url] = fut
+                    continue
+                _inflight[url] = _pool.submit(_check, url)
+                started.append(url)
+            futs[url] = _inflight[url]
+    # Outside the lock: the callback runs inline if the check already finished.
+    for url in started:
+        futs[url].add_done_callback(lambda f, u=url: _forget(u))
+    return futs
+
+def _forget(url):
+    with _lock:
+        _inflight.pop(url, None)
+
+def check_url(url):
+    return check_urls([url])[url].result()
+
+# ----- Annotation -----
+def annotate(text, verdicts, known=()):
+    """
+    Put [VERIFY] right after every link that is dead, or that does not appear in
+    `known` (the links the sources actually provided). Returns (text, flagged)
+    with flagged = [(url, reason)].
+    """
+    known = {cache.normalize_url(u) for u in known}
+    flagged = []
+    def mark(url, reason):
+        nonlocal text
+        flagged.append((url, reason))
+        needle = url[len("https://doi.org/"):] if url.startswith("https://doi.org/") and url not in text else url
+        # whole link only (optionally followed by punctuation), and not already marked
+        pattern = re.escape(needle) + r"(?=[.,;:!?*_]*(?:[\s<>()\[\]{}\"'`]|$))(?!\s*\[VERIFY)"
+        text = re.sub(pattern, lambda m: m.group(0) + " [VERIFY]", text)
+    for url, v in verdicts.items():
+        if not v["ok"]:
+            mark(url, f"dead ({v.get('status') or v.get('error')})")
+        elif known and cache.normalize_url(url) not in known:
+            mark(url, "not in sources")
+    return text, flagged
+
+def verify_citations(text, known=()):
+    """Check every URL/DOI in `text` concurrently and annotate it; returns (text, flagged)."""
+    futs = check_urls(extract_refs(text))
+    return annotate(text, {u: f.result() for u, f in futs.items()}, known)
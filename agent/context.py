@@ -0,0 +1,202 @@
+import os, re, json, math, hashlib
+from collections import Counter
+
+CONTEXT_TOKENS  = int(os.getenv("CONTEXT_TOKENS", "4096"))   # budget for packed results in a prompt
+PASSAGE_WORDS   = int(os.getenv("PASSAGE_WORDS", "120"))
+DUP_THRESHOLD   = float(os.getenv("DUP_THRESHOLD", "0.8"))   # shingle Jaccard above which passages count as duplicates
+
+_STOP = set("""a an and are as at be by for from has have in is it its of on or that the this to was were
+will with which who what when where how why not no do does did can may than then into about over
+under between more most such their there these those our your you we they he she i""".split())
+
+# ----- Tokens (tiktoken if installed, else a ~4 chars/token estimate) -----
+_enc = None
+def _encoder():
+    global _enc
+    if _enc is None:
+        try:
+            import tiktoken
+            _enc = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _enc = False
+    return _enc
+
+def count_tokens(text):
+    enc = _encoder()
+    if enc:
+        return len(enc.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+def truncate_tokens(text, n):
+    if n <= 0:
+        return ""
+    enc = _encoder()
+    if enc:
+        ids = enc.encode(text, disallowed_special=())
+        return text if len(ids) <= n else enc.decode(ids[:n])
+    return text[:n * 4]
+
+# ----- Relevance (BM25 over the candidate passages) -----
+def terms(text):
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in _STOP and len(w) > 1]
+
+def _term_stats(text, q):
+    """(length in terms, term frequencies of the query terms): all BM25 needs of a document."""
+    t = terms(text)
+    return len(t), Counter(w for w in t if w in q)
+
+def _bm25(stats, q, k1=1.5, b=0.75):
+    if not stats:
+        return []
+    n = len(stats)
+    avg = sum(length for length, _ in stats) / n or 1
+    df = Counter(w for _, tf in stats for w in tf)
+    scores = []
+    for length, tf in stats:
+        s = 0.0
+        for w in tf:
+            idf = math.log(1 + (n - df[w] + 0.5) / (df[w] + 0.5))
+            s += idf * tf[w] * (k1 + 1) / (tf[w] + k1 * (1 - b + b * length / avg))
+        scores.append(s)
+    return scores
+
+def bm25_scores(query, docs, k1=1.5, b=0.75):
+    q = set(terms(query))
+    return _bm25([_term_stats(d, q) for d in docs], q, k1, b)
+
+# ----- Near-duplicate passages -----
+def shingles(text, k=5):
+    words = terms(text)
+    if len(words) < k:
+        return {" ".join(words)}
+    return {hashlib.blake2b(" ".join(words[i:i+k]).encode(), digest_size=8).digest()
+            for i in range(len(words) - k + 1)}
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def split_passages(text, words=PASSAGE_WORDS):
+    out, cur = [], []
+    for para in re.split(r"\n\s*\n", text or ""):
+        w = para.split()
+        while w:
+            take = w[:words - len(cur)]
+            cur += take
+            w = w[len(take):]
+            if len(cur) >= words:
+                out.append(" ".join(cur))
+                cur = []
+    if cur:
+        out.append(" ".join(cur))
+    return out
+
+def best_span(text, query, max_chars=800):
+    """The window of whole sentences (≤ max_chars) with the most query-term hits."""
+    if len(text) <= max_chars:
+        return text
+    sents = re.split(r"(?<=[.!?])\s+|\n+", text)
+    q = set(terms(query))
+    hits = [sum(w in q for w in terms(s)) for s in sents]
+    best, best_score, lo, size, score = (0, 0), -1, 0, 0, 0
+    for hi, s in enumerate(sents):
+        size += len(s) + 1
+        score += hits[hi]
+        while size > max_chars and lo < hi:
+            size -= len(sents[lo]) + 1
+            score -= hits[lo]
+            lo += 1
+        if score > best_score:
+            best, best_score = (lo, hi), score
+    return " ".join(sents[best[0]:best[1] + 1])[:max_chars]
+
+# ----- Packing -----
+def pack(items, query, budget=CONTEXT_TOKENS, render=None, limit=None, passage_words=PASSAGE_WORDS):
+    """
+    items: iterable of (key, text), consumed once; text may also be a zero-arg
+    callable returning it. Splits each text into passages, ranks them by BM25
+    against `query`, drops near-duplicates and greedily fills `budget` tokens
+    of render(selected) output, truncating the last passage to fit. Only
+    term statistics are kept while ranking: a callable's text is dropped
+    after scoring and loaded again only when one of its passages is
+    considered, so pack-store texts are never all resident at once.
+    At most `limit` distinct keys are used; passage_words=None keeps each text whole.
+    Returns {key: [passage, ...]} with passages in their original order.
+    """
+    render = render or (lambda sel: "\n\n".join(p for ps in sel.values() for p in ps))
+    split = (lambda t: split_passages(t, passage_words)) if passage_words else (lambda t: [t] if t.strip() else [])
+    q = set(terms(query))
+    loaders, cands, stats = {}, [], []
+    for key, text in items:
+        load = text if callable(text) else (lambda t=text: t)
+        loaders.setdefault(key, load)
+        for i, p in enumerate(split(load())):
+            cands.append((key, i))
+            stats.append(_term_stats(p, q))
+    keys = list(dict.fromkeys(key for key, _ in cands))
+    scores = _bm25(stats, q)
+    order = sorted(range(len(cands)), key=lambda j: (-scores[j], j))
+    current = [None, None]   # (key, passages) of the one text loaded right now
+
+    def passage(key, i):
+        if current[0] != key:
+            current[:] = key, split(loaders[key]())
+        return current[1][i]
+    chosen, kept_shingles = {}, []
+    def selection():
+        return {key: [p for _, p in sorted(chosen[key])] for key in keys if key in chosen}
+
+    used = count_tokens(render({}))
+    for j in order:
+        key, i = cands[j]
+        if limit and key not in chosen and len(chosen) >= limit:
+            continue
+        p = passage(key, i)
+        sh = shingles(p)
+        if any(jaccard(sh, other) >= DUP_THRESHOLD for other in kept_shingles):
+            continue
+        chosen.setdefault(key, []).append((i, p))
+        cost = count_tokens(render(selection())) - used
+        if used + cost <= budget:
+            used += cost
+            kept_shingles.append(sh)
+            continue
+        # Doesn't fit: keep as much of it as the remaining budget allows, then stop.
+        chosen[key].remove((i, p))
+        if not chosen[key]:
+            del chosen[key]
+        room = budget - used
+        while room > 0:
+            chosen.setdefault(key, []).append((i, truncate_tokens(p, room)))
+            over = count_tokens(render(selection())) - budget
+            if over <= 0:
+                break
+            chosen[key].pop()
+            if not chosen[key]:
+                del chosen[key]
+            room -= over
+        break
+    return selection()
+
+def pack_results(results, query, budget=CONTEXT_TOKENS, limit=20):
+    """compactify-style JSON of research-pack records, packed to `budget` tokens."""
+    recs = [r for r in results if isinstance(r, dict) and r.get("url")]
+    def load(r):
+        # Pack-store records decode their text from the map on each call (agent/packstore.py).
+        text = r.get("text") or ""
+        if not text.strip() or text.startswith("[ERROR"):
+            text = r.get("snippet") or ""
+        return text
+
+    def items():
+        for idx, r in enumerate(recs):
+            yield idx, (lambda r=r: load(r))
+
+    def render(sel):
+        return json.dumps([{
+            "query": recs[idx].get("query", ""),
+            "title": recs[idx].get("title", ""),
+            "url": recs[idx].get("url", ""),
+            "excerpt": " … ".join(ps)
+        } for idx, ps in sel.items()], ensure_ascii=False)
+
+    return render(pack(items(), query, budget, render, limit))
@@ -0,0 +1,105 @@
+import os, re, heapq, hashlib, threading
+from array import array
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from . import cache
+from .context import shingles
+
+DEDUP_RESOLVE  = os.getenv("DEDUP_RESOLVE", "known")   # resolve redirects: "known" redirectors, "all" or "off"
+SIMHASH_BITS   = 64
+# SimHash picks candidates; shingle Jaccard confirms. On ~300-word pages a changed byline alone
+# moves a few bits, so the Hamming distance is loose and the Jaccard check does the deciding.
+SIMHASH_MAX_HD = int(os.getenv("SIMHASH_MAX_HD", "12"))
+DEDUP_JACCARD  = float(os.getenv("DEDUP_JACCARD", "0.8"))   # 5-shingle overlap counted as near-duplicate
+SKETCH_SIZE    = 128   # shingle hashes kept per page to estimate Jaccard (bottom-k sketch)
+SIMHASH_MIN_WORDS = 50
+
+# Params that only ever track; strip_tracking removes these from the URL that is fetched and cited.
+_TRACKERS = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|gbraid|wbraid|msclkid|yclid|mc_cid|mc_eid|igshid|"
+                       r"_ga|_gl|_hsenc|_hsmi|mkt_tok)$", re.I)
+# Those plus params that usually track but can select content (ref, src, share...); dedup keys only.
+_TRACKING = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|gbraid|wbraid|msclkid|yclid|mc_cid|mc_eid|igshid|"
+                       r"_ga|_gl|_hsenc|_hsmi|mkt_tok|ref|ref_src|ref_url|cmpid|spm|share|src|s_cid|rss)$", re.I)
+_REDIRECTORS = {"doi.org", "dx.doi.org", "t.co", "bit.ly", "goo.gl", "ow.ly", "buff.ly", "lnkd.in",
+                "tinyurl.com", "feedproxy.google.com", "news.google.com", "rebrand.ly", "trib.al"}
+
+# ----- URL canonicalization -----
+def _untracked(query, pattern=_TRACKING):
+    return urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if not pattern.match(k)])
+
+def strip_tracking(url):
+    """`url` without unambiguous trackers and fragment; otherwise unchanged, so it is still safe to fetch and cite."""
+    s = urlsplit(url)
+    return urlunsplit((s.scheme, s.netloc, s.path, _untracked(s.query, _TRACKERS) if s.query else "", ""))
+
+def canonical_url(url):
+    """Dedup key for a URL: normalized, tracking params dropped, www./scheme/trailing-slash variants folded."""
+    s = urlsplit(cache.normalize_url(url))
+    host = s.netloc[4:] if s.netloc.startswith("www.") else s.netloc
+    query = _untracked(s.query)
+    path = re.sub(r"/(amp|index\.html?)$", "", s.path).rstrip("/") or "/"
+    return urlunsplit(("https", host, path, query, ""))
+
+def needs_resolve(url):
+    if DEDUP_RESOLVE == "off":
+        return False
+    if DEDUP_RESOLVE == "all":
+        return True
+    host = (urlsplit(url).hostname or "").lower()
+    return host in _REDIRECTORS
+
+def resolve(url):
+    """Final URL after redirects (HEAD/ranged GET, verdict cached; see agent/citations.py)."""
+    from .citations import check_url
+    try:
+        return check_url(url).get("url") or url
+    except Exception:
+        return url
+
+# ----- Near-duplicate text (SimHash over word 3-shingles) -----
+def simhash(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SIMHASH_MIN_WORDS:
+        return None
+    v = [0] * SIMHASH_BITS
+    for i in range(len(words) - 2):
+        h = int.from_bytes(hashlib.blake2b(" ".join(words[i:i+3]).encode(), digest_size=8).digest(), "big")
+        for b in range(SIMHASH_BITS):
+            v[b] += 1 if h >> b & 1 else -1
+    return sum(1 << b for b in range(SIMHASH_BITS) if v[b] > 0)
+
+def sketch(text):
+    """The SKETCH_SIZE smallest 5-shingle hashes of `text`: a fixed-size stand-in for its shingle set."""
+    digest = lambda h: h if isinstance(h, bytes) else hashlib.blake2b(h.encode(), digest_size=8).digest()
+    hashes = (int.from_bytes(digest(h), "big") for h in shingles(text))
+    return array("Q", sorted(heapq.nsmallest(SKETCH_SIZE, hashes)))
+
+def sketch_jaccard(a, b):
+    """Estimated Jaccard of the shingle sets behind two sketches (bottom-k of their union)."""
+    union = heapq.nsmallest(SKETCH_SIZE, set(a) | set(b))
+    both = set(a) & set(b)
+    return sum(h in both for h in union) / len(union) if union else 0.0
+
+class NearDupIndex:
+    """
+    Remembers a SimHash and a bottom-k shingle sketch (about 1 KB) of each
+    accepted text; add() returns the key of an earlier near-duplicate, if any.
+    """
+
+    def __init__(self, max_distance=SIMHASH_MAX_HD, min_jaccard=DEDUP_JACCARD):
+        self.max_distance = max_distance
+        self.min_jaccard = min_jaccard
+        self._lock = threading.Lock()
+        self._seen = []
+
+    def add(self, key, text):
+        h = simhash(text or "")
+        if h is None:
+            return None
+        sk = sketch(text)
+        with self._lock:
+            for other_key, other, other_sk in self._seen:
+                if (bin(h ^ other).count("1") <= self.max_distance
+                        and sketch_jaccard(sk, other_sk) >= self.min_jaccard):
+                    return other_key
+            self._seen.append((key, h, sk))
+        return None
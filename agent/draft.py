@@ -0,0 +1,186 @@
+"""
+Sections (5)-(7) drafted as independent units: one per outline section plus
+one for Limitations & Next Checks.
+
+    units = plan_units(user_brief, outline, summaries)   # [] if the outline has no usable sections
+    for chunk in write_units(units, previous): ...       # draft text, in outline order
+    ck.put("draft_units", unit_manifest(units))
+
+Each unit is keyed by a hash of exactly what it is written from: its model
+and messages, i.e. the brief, the section's outline heading and sub-points,
+and the source summaries routed to it (BM25 against the heading). Editing one
+heading or adding one source changes only the keys of the sections it
+touches; write_units() calls the model for those alone, in parallel, and
+takes the rest from `previous` (an earlier manifest). enforce_marks runs on
+each unit as it is written, and the bibliography is merged from the units'
+reference lists on every write, so unchanged sections cost nothing.
+Limitations depends on every heading and the full summaries, so it is
+rewritten whenever anything changes; it is one short call.
+"""
+import os, re, json, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from . import ollama, trace
+from .citations import extract_refs
+from .context import bm25_scores
+from .dedup import canonical_url
+from .tools import llm_chat, enforce_marks, model_for
+from .workflow import section_messages, limitations_messages
+
+SECTION_SOURCES = int(os.getenv("SECTION_SOURCES", "6"))   # source summaries routed to each section
+
+# ----- Outline and summaries -> units -----
+_HEADING = re.compile(r"^(#{1,6})\s+")
+_BULLET  = re.compile(r"^[-*•+]\s+")
+_NUMBER  = re.compile(r"^\(?(\d+|[IVXLC]+|[A-Za-z])[.)]\s+")
+_BOLD    = re.compile(r"^\*\*[^*]+\*\*:?$")
+
+def _kind(line):
+    for name, rx in (("heading", _HEADING), ("number", _NUMBER), ("bullet", _BULLET), ("bold", _BOLD)):
+        if rx.match(line):
+            return name
+    return None
+
+def _title(line):
+    line = _HEADING.sub("", line)
+    line = _NUMBER.sub("", _BULLET.sub("", line))
+    return line.replace("**", "").strip().rstrip(":").strip()
+
+def outline_sections(outline):
+    """[(heading, notes)] for the top-level items of the Outline block; [] if there are fewer than two."""
+    lines = (outline or "").splitlines()
+    start = next((i for i, l in enumerate(lines) if re.search(r"\boutline\b", l, re.I) and len(l.split()) <= 6), None)
+    if start is None:
+        return []
+    level = _HEADING.match(lines[start].strip())
+    block = []
+    for line in lines[start + 1:]:
+        s = line.strip()
+        h = _HEADING.match(s)
+        if re.search(r"search quer|databases", s, re.I) or s.startswith("(3)") or (
+                h and level and len(h.group(1)) <= len(level.group(1))):
+            break
+        block.append(line)
+    items = [(len(l) - len(l.lstrip()), _kind(l.strip())) for l in block]
+    top = [(indent, kind) for indent, kind in items if kind]
+    if not top:
+        return []
+    indent = min(i for i, _ in top)
+    kind = "heading" if any(k == "heading" for _, k in top) else next(k for i, k in top if i == indent)
+    sections = []
+    for line, (ind, k) in zip(block, items):
+        if k == kind and (kind == "heading" or ind == indent):
+            sections.append([_title(line.strip()), []])
+        elif sections and line.strip():
+            sections[-1][1].append(line.rstrip())
+    sections = [(h, "\n".join(notes)) for h, notes in sections if h]
+    return sections if len(sections) >= 2 else []
+
+def source_entries(summaries):
+    """The summaries split into per-source entries: list items, headed blocks or paragraphs that carry a link."""
+    entries, cur = [], []
+    for line in (summaries or "").splitlines():
+        s = line.strip()
+        if not s or _HEADING.match(s) or (line[:1] not in " \t" and (_BULLET.match(s) or _NUMBER.match(s))):
+            if cur:
+                entries.append("\n".join(cur))
+            cur = [line] if s and not _HEADING.match(s) else []
+        else:
+            cur.append(line)
+    if cur:
+        entries.append("\n".join(cur))
+    return [e.strip() for e in entries if extract_refs(e)]
+
+def _route(query, entries, fallback, k):
+    scores = bm25_scores(query, entries)
+    picked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: -scores[i])[:k]
+    if not picked:
+        scores = bm25_scores(fallback, entries)
+        picked = sorted(range(len(entries)), key=lambda i: -scores[i])[:k]
+    return [entries[i] for i in sorted(picked)]   # summaries order, so score ties can't reorder the prompt
+
+def _key(model, msgs):
+    return hashlib.sha256(json.dumps([model, msgs], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def plan_units(user_brief, outline, summaries, k=SECTION_SOURCES):
+    """One unit per outline section plus Limitations; [] when the outline can't be split."""
+    sections = outline_sections(outline)
+    if not sections:
+        return []
+    entries = source_entries(summaries)
+    model = model_for("step_5_6_7")
+    units = []
+    for heading, notes in sections:
+        sources = _route(f"{heading}\n{notes}", entries, user_brief, k)
+        msgs = section_messages(user_brief, heading, notes, "\n\n".join(sources))
+        units.append({"kind": "section", "heading": heading, "sources": sources,
+                      "model": model, "msgs": msgs, "key": _key(model, msgs)})
+    msgs = limitations_messages(user_brief, [h for h, _ in sections], summaries)
+    units.append({"kind": "limitations", "heading": "Limitations & Next Checks", "sources": [],
+                  "model": model, "msgs": msgs, "key": _key(model, msgs)})
+    return units
+
+# ----- Writing -----
+_REFS = re.compile(r"^\W*(references|works cited|sources cited|bibliography)\W*$", re.I | re.M)
+
+def _split_refs(text, sources):
+    """(body, reference lines); sources cited in the body stand in when the model lists no references."""
+    heads = list(_REFS.finditer(text))
+    if heads:
+        body, tail = text[:heads[-1].start()], text[heads[-1].end():]
+        refs = [_BULLET.sub("", _NUMBER.sub("", l.strip())) for l in tail.splitlines() if l.strip()]
+    else:
+        body, cited = text, {canonical_url(u) for u in extract_refs(text)}
+        refs = [_BULLET.sub("", s.splitlines()[0].strip()) for s in sources
+                if any(canonical_url(u) in cited for u in extract_refs(s))]
+    return body.strip(), refs
+
+def _write_unit(unit):
+    with trace.span("draft_unit", kind=unit["kind"], key=unit["key"]):
+        text = llm_chat(unit["msgs"], model=unit["model"])
+    if unit["kind"] == "limitations":
+        return enforce_marks(text.strip()), []
+    body, refs = _split_refs(text, unit["sources"])
+    return enforce_marks(body), refs
+
+def merge_bibliography(units):
+    """Reference lines of every section, one per source (by canonical URL, else text), sorted."""
+    seen, out = set(), []
+    for unit in units:
+        for ref in unit.get("refs") or []:
+            urls = extract_refs(ref)
+            key = canonical_url(urls[0]) if urls else " ".join(ref.lower().split())
+            if key not in seen:
+                seen.add(key)
+                out.append(ref)
+    return sorted(out, key=lambda r: r.lstrip("*_\"'“").lower())
+
+def write_units(units, previous=None, workers=None):
+    """
+    Yield the draft in outline order: (5) sections, (6) the merged
+    bibliography, (7) limitations. Units whose key is in `previous` are
+    reused; all the others are submitted together on the first next().
+    """
+    done = {u["key"]: u for u in previous or () if u.get("text") is not None}
+    stale = [u for u in units if u["key"] not in done]
+    pool = ThreadPoolExecutor(max_workers=max(1, min(len(stale), workers or ollama.capacity())),
+                              thread_name_prefix="draft")
+    futs = {u["key"]: pool.submit(_write_unit, u) for u in stale}
+    try:
+        with trace.span("step_5_6_7", units=len(units), rewritten=len(stale)):
+            yield "(5) Draft sections\n"
+            for unit in units:
+                if unit["key"] in futs:
+                    unit["text"], unit["refs"] = futs[unit["key"]].result()
+                else:
+                    unit["text"], unit["refs"] = done[unit["key"]]["text"], done[unit["key"]]["refs"]
+                if unit["kind"] == "section":
+                    yield f"\n### {unit['heading']}\n\n{unit['text']}\n"
+            yield "\n(6) Provisional bibliography\n\n"
+            yield "".join(f"- {ref}\n" for ref in merge_bibliography(units)) or "[CITE] No sources were cited.\n"
+            yield "\n(7) Limitations & Next Checks\n\n" + "".join(u["text"] for u in units if u["kind"] == "limitations") + "\n"
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)   # closed early: drop the units not yet started
+
+def unit_manifest(units):
+    """What a later write_units() needs to reuse these units (no messages)."""
+    return [{k: u.get(k) for k in ("kind", "heading", "key", "text", "refs")} for u in units]
@@ -0,0 +1,90 @@
+import os, re, sqlite3, threading
+
+FTS_DB = os.getenv("FTS_DB", "data/fts.sqlite")
+
+_local = threading.local()
+_TABLES = ("chunks", "pages")   # pages: fetched pages + user docs for web_search (path=url, page=title)
+
+# ----- Local inverted index (SQLite FTS5, ranked with its built-in BM25) -----
+# id and path are UNINDEXED in the FTS table, so a DELETE by either scans the whole table.
+# A plain side table {table}_ids maps them to FTS rowids; deletes go by rowid.
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(FTS_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(FTS_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for table in _TABLES:
+            conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                id UNINDEXED, path UNINDEXED, page UNINDEXED, text,
+                tokenize='porter unicode61')""")
+            fresh = conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (f"{table}_ids",)).fetchone() is None
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_ids (id TEXT PRIMARY KEY, path TEXT, rid INTEGER)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_ids_path ON {table}_ids(path)")
+            if fresh:   # an index built before the side table existed: one scan to fill it
+                conn.execute(f"INSERT OR REPLACE INTO {table}_ids SELECT id, path, rowid FROM {table}")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def count(table="chunks"):
+    return _db().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def _delete_rids(conn, table, rids):
+    conn.executemany(f"DELETE FROM {table} WHERE rowid=?", rids)
+    conn.executemany(f"DELETE FROM {table}_ids WHERE rid=?", rids)
+
+def upsert(rows, table="chunks"):
+    """rows: iterable of (id, path, page, text)."""
+    rows = list(rows)
+    conn = _db()
+    old = []
+    for r in rows:
+        hit = conn.execute(f"SELECT rid FROM {table}_ids WHERE id=?", (r[0],)).fetchone()
+        if hit:
+            old.append(hit)
+    if old:   # nothing to delete for new ids (e.g. a file indexed for the first time)
+        _delete_rids(conn, table, old)
+    for r in rows:
+        rid = conn.execute(f"INSERT INTO {table}(id, path, page, text) VALUES (?,?,?,?)", r).lastrowid
+        conn.execute(f"INSERT OR REPLACE INTO {table}_ids VALUES (?,?,?)", (r[0], r[1], rid))
+    conn.commit()
+
+def delete_path(path, table="chunks"):
+    conn = _db()
+    rids = conn.execute(f"SELECT rid FROM {table}_ids WHERE path=?", (path,)).fetchall()
+    if rids:
+        _delete_rids(conn, table, rids)
+        conn.commit()
+
+def paths(prefix="", table="chunks"):
+    """Distinct paths in `table` starting with `prefix`."""
+    rows = _db().execute(f"SELECT DISTINCT path FROM {table}_ids WHERE path >= ? AND path < ?",
+                         (prefix, prefix + "\U0010ffff")).fetchall()
+    return {r[0] for r in rows}
+
+def match_expr(query):
+    """
+    Turn free text or a Boolean search string ("carbon pricing" AND OECD) into
+    an FTS5 OR-query of its phrases and terms; BM25 then rewards documents that
+    contain more (and rarer) of them instead of demanding all.
+    """
+    phrases = re.findall(r'"([^"]+)"', query)
+    rest = re.sub(r'"[^"]*"', " ", query)
+    words = [w for w in re.findall(r"[^\W_]+", rest) if w not in ("AND", "OR", "NOT", "NEAR")]
+    parts = []
+    for p in phrases + words:
+        p = " ".join(re.findall(r"[^\W_]+", p))
+        if p and f'"{p}"' not in parts:
+            parts.append(f'"{p}"')
+    return " OR ".join(parts)
+
+def search(query, k=10, table="chunks"):
+    """Return [{"id","path","page","text","score"}] best first (higher score is better)."""
+    expr = match_expr(query)
+    if not expr:
+        return []
+    rows = _db().execute(
+        f"SELECT id, path, page, text, bm25({table}) FROM {table} WHERE {table} MATCH ? "
+        f"ORDER BY bm25({table}) LIMIT ?", (expr, k)).fetchall()
+    return [{"id": r[0], "path": r[1], "page": r[2], "text": r[3], "score": -r[4]} for r in rows]
@@ -0,0 +1,111 @@
+"""
+Long-lived memory service: keeps the embedder and the persistent Chroma
+collection warm so rag_recall/index_folder cost milliseconds instead of a
+model load per process.
+
+    python -m agent.memd            # serve on MEMD_ADDR (default 127.0.0.1:8765)
+
+agent.tools uses the service automatically when it is reachable and falls
+back to in-process retrieval otherwise.
+
+Connections carry pickles, so both sides authenticate with a shared secret:
+MEMD_AUTHKEY, or else a random key the server writes to MEMD_KEY_FILE
+(mode 0600) on first start. Without either the client doesn't connect.
+"""
+import os, secrets, threading
+
+MEMD_ADDR     = os.getenv("MEMD_ADDR", "127.0.0.1:8765")   # empty disables the client
+MEMD_KEY_FILE = os.getenv("MEMD_KEY_FILE", "data/memd.key")
+
+def _authkey(create=False):
+    """MEMD_AUTHKEY, else the key in MEMD_KEY_FILE (generated there if `create`); None if there is none."""
+    if os.getenv("MEMD_AUTHKEY"):
+        return os.getenv("MEMD_AUTHKEY").encode()
+    try:
+        with open(MEMD_KEY_FILE, "rb") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        if not create:
+            return None
+    os.makedirs(os.path.dirname(MEMD_KEY_FILE) or ".", exist_ok=True)
+    key = secrets.token_hex(32).encode()
+    fd = os.open(MEMD_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(key)
+    return key
+
+def _address():
+    host, port = MEMD_ADDR.rsplit(":", 1)
+    return host, int(port)
+
+# ----- Client -----
+_conn = None
+_down = False
+_lock = threading.Lock()
+
+def call(op, **args):
+    """Run `op` in the service; returns None if no service is reachable."""
+    global _conn, _down
+    if not MEMD_ADDR or _down:
+        return None
+    key = _authkey()
+    if key is None:
+        _down = True   # no key, so no service of ours to talk to
+        return None
+    from multiprocessing import AuthenticationError
+    with _lock:
+        for attempt in range(2):
+            try:
+                if _conn is None:
+                    from multiprocessing.connection import Client
+                    _conn = Client(_address(), authkey=key)
+                _conn.send((op, args))
+                ok, result = _conn.recv()
+                break
+            except AuthenticationError:
+                _conn, _down = None, True   # someone else's service, or a stale key: retrying won't help
+                return None
+            except (OSError, EOFError):
+                _conn = None
+                if attempt:
+                    _down = True   # don't retry the socket on every call
+                    return None
+    if not ok:
+        raise RuntimeError(f"memd {op} failed: {result}")
+    return result
+
+# ----- Server -----
+def _handle(conn, ops):
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                conn.send((True, ops[op](**args)))
+            except Exception as e:
+                conn.send((False, f"{type(e).__name__}: {e}"))
+
+def serve():
+    from multiprocessing.connection import Listener
+    from . import tools
+    tools.get_embedder()                       # load once, stay warm
+    tools.get_chroma().get_or_create_collection("jarvis_mem")
+    ops = {
+        "recall": tools.rag_recall_local,
+        "index": tools.index_folder_local,
+        "ping": lambda: "pong",
+    }
+    with Listener(_address(), authkey=_authkey(create=True)) as listener:
+        print(f"[memd] serving on {MEMD_ADDR}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:             # bad authkey etc.
+                print(f"[memd] rejected connection: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn, ops), daemon=True).start()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,89 @@
+"""
+Pool of Ollama endpoints with per-endpoint slot limits.
+
+    OLLAMA_URLS=http://gpu1:11434#4,http://gpu2:11434#2   # url#slots; slots default to OLLAMA_SLOTS
+
+Each request holds one slot of one endpoint for its whole duration (a stream
+holds it until the last chunk). Set slots to the server's OLLAMA_NUM_PARALLEL:
+more concurrent requests than that only queue inside Ollama. An endpoint is
+picked by: a free slot, then the model already loaded there (no swap), then
+the lowest load. An endpoint that refuses connections sits out for a while.
+"""
+import os, time, threading
+from contextlib import contextmanager
+
+OLLAMA_URLS  = os.getenv("OLLAMA_URLS") or os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_SLOTS = int(os.getenv("OLLAMA_SLOTS", "4"))
+COOLDOWN     = float(os.getenv("OLLAMA_COOLDOWN", "30"))   # seconds an unreachable endpoint is skipped
+MODELS_PER_ENDPOINT = int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "1"))
+
+class Endpoint:
+    def __init__(self, url, slots):
+        self.url = url.rstrip("/")
+        self.slots = slots
+        self.in_flight = 0
+        self.models = []          # most recently used last
+        self.down_until = 0.0
+
+    def __repr__(self):
+        return f"Endpoint({self.url}, {self.in_flight}/{self.slots})"
+
+def _parse(spec):
+    out = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, slots = item.partition("#")
+        out.append(Endpoint(url, int(slots) if slots else OLLAMA_SLOTS))
+    return out
+
+class Pool:
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+        self._cond = threading.Condition()
+
+    def capacity(self):
+        return sum(ep.slots for ep in self.endpoints)
+
+    def _pick(self, model):
+        now = time.time()
+        free = [ep for ep in self.endpoints if ep.in_flight < ep.slots and ep.down_until <= now]
+        if not free:
+            # Everything busy, or everything marked down: a down endpoint with a free slot beats waiting forever.
+            if all(ep.down_until > now for ep in self.endpoints):
+                free = [ep for ep in self.endpoints if ep.in_flight < ep.slots]
+            if not free:
+                return None
+        return min(free, key=lambda ep: (model not in ep.models, ep.in_flight / ep.slots))
+
+    @contextmanager
+    def endpoint(self, model):
+        """Hold a slot on the best endpoint for `model` until the block exits."""
+        with self._cond:
+            ep = self._pick(model)
+            while ep is None:
+                self._cond.wait()
+                ep = self._pick(model)
+            ep.in_flight += 1
+            if model in ep.models:
+                ep.models.remove(model)
+            ep.models = (ep.models + [model])[-MODELS_PER_ENDPOINT:]
+        try:
+            yield ep
+        except Exception as e:
+            if any(c.__name__ in ("ConnectionError", "ConnectTimeout") for c in type(e).__mro__):
+                ep.down_until = time.time() + COOLDOWN   # unreachable; route around it for a while
+            raise
+        finally:
+            with self._cond:
+                ep.in_flight -= 1
+                self._cond.notify()
+
+pool = Pool(_parse(OLLAMA_URLS))
+
+def endpoint(model):
+    return pool.endpoint(model)
+
+def capacity():
+    return pool.capacity()
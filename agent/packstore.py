@@ -0,0 +1,122 @@
+"""
+On-disk research pack: record metadata in records.jsonl, page texts appended
+to text.bin and read back through a memory map.
+
+    store = PackStore("data/runs/a/pack")     # creates or reopens
+    rec = store.append({"query": q, "url": u, "title": t, "snippet": s, "text": text})
+    rec["text"]                                # decoded from the map on demand
+    for rec in PackStore("data/runs/a/pack"):  # reload in another run or process
+        ...
+
+Records are Record views: plain dicts of the small fields whose "text" is
+only materialized when asked for, so a pack's size on disk does not become
+resident memory. The files are append-only, which makes a pack safe to read
+while it is still being written. PackStore.temp() is a scratch store for runs
+without a checkpoint; discard() deletes it.
+"""
+import os, json, mmap, shutil, tempfile, threading
+
+class Record(dict):
+    """A pack record; the page text stays in the store until record["text"] is read."""
+
+    def __init__(self, store, meta):
+        super().__init__(meta)
+        self._store = store
+
+    def text_bytes(self):
+        """Zero-copy memoryview of the UTF-8 text."""
+        off, n = dict.__getitem__(self, "text_at")
+        return self._store.view(off, n)
+
+    def __getitem__(self, key):
+        if key == "text":
+            return str(self.text_bytes(), "utf-8")
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == "text":
+            return self["text"]
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        return key == "text" or super().__contains__(key)
+
+class PackStore:
+    def __init__(self, root):
+        self.root = root
+        self.temporary = False
+        os.makedirs(root, exist_ok=True)
+        self._meta_path = os.path.join(root, "records.jsonl")
+        self._text_path = os.path.join(root, "text.bin")
+        self._lock = threading.Lock()
+        self._map = None
+        self.records = []
+        torn = False
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    torn = not line.endswith("\n")
+                    try:
+                        self.records.append(Record(self, json.loads(line)))
+                    except ValueError:
+                        pass   # a line torn by a crash mid-append; the records around it are intact
+        self._meta = open(self._meta_path, "a", encoding="utf-8")
+        if torn:
+            self._meta.write("\n")
+        self._text = open(self._text_path, "ab")
+        self._size = self._text.tell()
+
+    @classmethod
+    def temp(cls):
+        """A scratch store in the system temp dir, for a run that keeps no checkpoint."""
+        store = cls(tempfile.mkdtemp(prefix="pack-"))
+        store.temporary = True
+        return store
+
+    def append(self, rec):
+        """Store `rec` (its "text" goes to text.bin) and return its Record view."""
+        data = (rec.get("text") or "").encode("utf-8")
+        meta = {k: v for k, v in rec.items() if k != "text"}
+        with self._lock:
+            meta["text_at"] = [self._size, len(data)]
+            self._text.write(data)
+            self._text.flush()
+            self._size += len(data)
+            self._meta.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            self._meta.flush()
+            view = Record(self, meta)
+            self.records.append(view)
+        return view
+
+    def view(self, off, n):
+        if n == 0:
+            return memoryview(b"")
+        with self._lock:
+            if self._map is None or len(self._map) < off + n:
+                # (Re)map after appends; readers holding old views keep the old map alive.
+                with open(self._text_path, "rb") as fh:
+                    self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[off:off + n]
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        with self._lock:
+            self._meta.close()
+            self._text.close()
+
+    def discard(self):
+        """Close and delete the store; its Record views can no longer load text."""
+        self.close()
+        with self._lock:
+            if self._map is not None:
+                try:
+                    self._map.close()
+                except BufferError:
+                    pass   # a caller still holds a memoryview; the map goes when it does
+                self._map = None
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,94 @@
+import io, os, hashlib, threading
+from . import cache
+
+PDF_WORKERS    = int(os.getenv("PDF_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PDF_BATCH      = int(os.getenv("PDF_BATCH", "8"))     # pages per worker task
+PDF_POOL_PAGES = int(os.getenv("PDF_POOL_PAGES", "16"))  # smaller uncached work stays in-process
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pool
+
+def file_sha(path):
+    """sha256 of a PDF given as a path or as bytes (e.g. a downloaded body)."""
+    if isinstance(path, (bytes, bytearray)):
+        return hashlib.sha256(path).hexdigest()
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _reader(path):
+    from pypdf import PdfReader
+    return PdfReader(io.BytesIO(path) if isinstance(path, (bytes, bytearray)) else path)
+
+def _extract(path, pages):
+    # Runs in a worker process: one reader per task, text for each 0-based page index.
+    reader = _reader(path)
+    return [reader.pages[i].extract_text() or "" for i in pages]
+
+def page_count(path, sha=None):
+    sha = sha or file_sha(path)
+    row = cache.get("pdfmeta", sha)
+    if row:
+        return int(row["value"])
+    n = len(_reader(path).pages)
+    cache.put("pdfmeta", sha, str(n))
+    return n
+
+# ----- Page stream (cached per file hash + page) -----
+def iter_pages(path, max_pages=None, workers=None):
+    """
+    Yield {"page", "text"} in page order. Cached pages come straight from the
+    text cache; the rest are extracted PDF_BATCH pages at a time across a process
+    pool. Stopping the generator early cancels extraction that hasn't started.
+    `path` may also be the PDF's bytes; pages are cached by content hash either way.
+    """
+    sha = file_sha(path)
+    n = page_count(path, sha)
+    if max_pages is not None:
+        n = min(n, max_pages)
+    cached = {}
+    for i in range(n):
+        row = cache.get("pdfpage", f"{sha}:{i+1}")
+        if row:
+            cached[i] = row["value"]
+    missing = [i for i in range(n) if i not in cached]
+    workers = PDF_WORKERS if workers is None else workers
+
+    if len(missing) < PDF_POOL_PAGES or workers <= 1:
+        # Few pages to extract: one in-process reader, pages pulled on demand.
+        reader = _reader(path) if missing else None
+        batches = [([i], None) for i in missing]
+        texts = lambda b: [reader.pages[b[0][0]].extract_text() or ""]
+    else:
+        pool = _executor()
+        batches = [(missing[j:j+PDF_BATCH], None) for j in range(0, len(missing), PDF_BATCH)]
+        batches = [(b, pool.submit(_extract, path, b)) for b, _ in batches]
+        texts = lambda b: b[1].result()
+
+    pending = iter(batches)
+    ready = {}
+    try:
+        for i in range(n):
+            if i in cached:
+                yield {"page": i + 1, "text": cached[i]}
+                continue
+            while i not in ready:
+                b = next(pending)
+                for j, text in zip(b[0], texts(b)):
+                    cache.put("pdfpage", f"{sha}:{j+1}", text)
+                    ready[j] = text
+            yield {"page": i + 1, "text": ready.pop(i)}
+    finally:
+        for _, fut in batches:
+            if fut is not None:
+                fut.cancel()
@@ -0,0 +1,238 @@
+import os, json, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+from . import ollama
+from .citations import check_urls, extract_refs, verify_citations
+from .context import bm25_scores, terms
+from .draft import plan_units, write_units, unit_manifest
+from .packstore import PackStore, Record
+from .research import ResearchPack
+from .workflow import (step_1_2_3, step_4, step_5_6_7, summarize_source, reduce_summaries,
+                       compactify, extract_queries, stream_queries)
+
+LLM_PARALLEL = int(os.getenv("LLM_PARALLEL", "0")) or ollama.capacity()   # map calls in flight; default: every endpoint slot
+MAP_LIMIT    = int(os.getenv("MAP_LIMIT", "24"))     # max sources summarized per brief, best BM25 match to the brief first
+
+DEFAULT_QUERIES = [
+    '("carbon pricing" OR "carbon tax") AND ("emission reduction" OR "GHG") AND OECD AND 2015..2025',
+    '("cap-and-trade" OR ETS OR "emissions trading system") AND ("difference-in-differences" OR DID) OECD',
+    '"command-and-control" regulation climate policy empirical OECD',
+    '"sectoral standards" carbon pricing interaction empirical',
+    '"World Bank" "Carbon Pricing Dashboard" OECD 2015..2025'
+]
+
+def echo(chunks, out=print):
+    for chunk in chunks:
+        out(chunk, end="", flush=True)
+        yield chunk
+    out()
+
+def _usable(rec):
+    text = rec.get("text") or ""
+    return bool(rec.get("snippet")) or (text.strip() and not text.startswith("[ERROR"))
+
+def _head(rec):
+    """What a source is ranked on: its title and snippet (or the start of its text)."""
+    return f"{rec.get('title') or ''}\n{rec.get('snippet') or (rec.get('text') or '')[:500]}"
+
+# ----- Per-step checkpoints -----
+class Checkpoint:
+    """
+    Step outputs of one brief under `root` (outline.md, research_pack.json,
+    summaries.md, draft.md) so a crashed run resumes after the last completed
+    step. Page texts live in the pack store under root/pack; research_pack.json
+    only lists the records. draft_units.json keeps the draft's sections with
+    their dependency keys, so after outline.md or summaries.md is edited only
+    the affected sections are rewritten. Checkpoint(None) keeps nothing.
+    """
+    _JSON = ("research_pack", "draft_units")
+
+    def __init__(self, root):
+        self.root = root
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    def path(self, step):
+        return os.path.join(self.root, step + (".json" if step in self._JSON else ".md"))
+
+    def get(self, step):
+        if not self.root or not os.path.exists(self.path(step)):
+            return None
+        with open(self.path(step), "r", encoding="utf-8") as fh:
+            return json.load(fh) if step in self._JSON else fh.read()
+
+    def put(self, step, value):
+        if not self.root:
+            return
+        tmp = self.path(step) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            if step in self._JSON:
+                json.dump(value, fh, ensure_ascii=False)
+            else:
+                fh.write(value)
+        os.replace(tmp, self.path(step))
+
+    def store(self):
+        """An empty pack store; one left by an interrupted run is wiped, as research_pack.json doesn't list it."""
+        if not self.root:
+            return PackStore.temp()
+        shutil.rmtree(os.path.join(self.root, "pack"), ignore_errors=True)
+        return PackStore(os.path.join(self.root, "pack"))
+
+    def clear(self):
+        """Drop every step and the pack store, so the next run starts over."""
+        if not self.root:
+            return
+        for step in ("outline", "research_pack", "summaries", "draft", "draft_units"):
+            if os.path.exists(self.path(step)):
+                os.remove(self.path(step))
+        shutil.rmtree(os.path.join(self.root, "pack"), ignore_errors=True)
+
+# ----- Pipelined brief -----
+def run_brief(user_brief, say=None, pipelined=True, checkpoint=None, out=print):
+    """
+    Run steps 1-7 for one brief with the stages overlapped:
+    search+fetch starts while the outline streams, and each fetched source is
+    summarized (map) the moment it lands, so Section 4 is a short reduce over
+    per-source notes. pipelined=False keeps the one-shot step_4 over compactify.
+    Steps already saved in `checkpoint` are loaded instead of re-run.
+    Returns a dict with outline, queries, research_pack, summaries and draft.
+    Without a checkpoint the page texts live in a temporary pack store that is
+    deleted on return, so the returned records carry metadata only.
+    """
+    ck = checkpoint or Checkpoint(None)
+    scratch = []
+    try:
+        res = _run_brief(user_brief, say, pipelined, ck, out, scratch)
+    finally:
+        for store in scratch:
+            store.discard()
+    if scratch:
+        res["research_pack"] = [{k: v for k, v in dict.items(r) if k != "text_at"} for r in res["research_pack"]]
+    return res
+
+def _run_brief(user_brief, say, pipelined, ck, out, scratch):
+    say = say or (lambda text: None)
+    show = lambda chunks: echo(chunks, out)
+    llm = ThreadPoolExecutor(max_workers=LLM_PARALLEL, thread_name_prefix="llm")
+    lock = threading.Lock()
+    mapped = {}
+    wanted = set(terms(user_brief))
+
+    def on_record(rec):
+        # Map early only sources that share a term with the brief; the final cut by rank is made below.
+        if not pipelined or not _usable(rec) or not wanted & set(terms(_head(rec))):
+            return
+        with lock:
+            if id(rec) in mapped or len(mapped) >= MAP_LIMIT:
+                return
+            mapped[id(rec)] = llm.submit(summarize_source, user_brief, rec)
+
+    say("Got your brief. Generating outline and search queries.")
+
+    # (1)-(2)-(3), streamed; search+fetch starts as each query line arrives
+    out("\n=== (1)-(2)-(3): Refined question, Outline, Search queries ===\n")
+    outline, packed = ck.get("outline"), ck.get("research_pack")
+    if outline is not None:
+        out(outline)
+    if packed is None:
+        store = ck.store()
+        if store.temporary:
+            scratch.append(store)
+        with ResearchPack(k=6, on_record=on_record, store=store) as pack:
+            if outline is None:
+                outline = "".join(show(stream_queries(step_1_2_3(user_brief, stream=True), pack.submit)))
+                ck.put("outline", outline)
+
+            # Extract queries (robust)
+            queries = extract_queries(outline)
+            out("\n[INFO] Web queries:", queries)
+            if not queries:
+                out("[WARN] No queries found in the outline. Using safe defaults.")
+                queries = list(DEFAULT_QUERIES)
+            for q in queries:
+                pack.submit(q)
+            research_pack = pack.records()
+            st = pack.stats
+            out(f"[INFO] {len(research_pack)} unique sources from {st['hits']} hits "
+                f"({st['same_url']} repeat URLs, {st['near_dup']} near-duplicates dropped)")
+        store.close()
+        ck.put("research_pack", {"queries": queries, "pack": store.root, "records": research_pack})
+    else:
+        queries, research_pack = packed["queries"], packed["records"]
+        if packed.get("pack"):   # records point into the pack store; texts load on demand
+            store = PackStore(packed["pack"])
+            store.close()
+            research_pack = [Record(store, r) if "text_at" in r else r for r in research_pack]
+
+    # (4) Source summaries
+    say("Summarizing sources from the web.")
+    out("\n=== (4): Source summaries (with links/DOIs) ===\n")
+    summaries = ck.get("summaries")
+    if summaries is not None:
+        out(summaries)
+    elif pipelined:
+        # Keep the MAP_LIMIT sources that best match the brief, not the first to arrive;
+        # ties go to ones already mapped. Records restored from a checkpoint haven't been mapped yet.
+        usable = [r for r in research_pack if _usable(r)]
+        scores = bm25_scores(user_brief, [_head(r) for r in usable])
+        ranked = sorted(range(len(usable)), key=lambda i: (-scores[i], id(usable[i]) not in mapped))
+        keep = {id(usable[i]) for i in ranked[:MAP_LIMIT]}
+        for rec in usable:
+            if id(rec) not in keep and id(rec) in mapped:
+                mapped.pop(id(rec)).cancel()
+            elif id(rec) in keep and id(rec) not in mapped:
+                mapped[id(rec)] = llm.submit(summarize_source, user_brief, rec)
+        if len(usable) > len(keep):
+            out(f"[INFO] Summarizing the {len(keep)} of {len(usable)} sources that best match the brief "
+                f"(MAP_LIMIT={MAP_LIMIT}; {len(usable) - len(keep)} dropped)")
+        notes = []
+        for rec in research_pack:
+            fut = mapped.get(id(rec))
+            if fut is None:
+                continue
+            try:
+                note = fut.result().strip()
+            except Exception as e:
+                out(f"[WARN] summary failed for {rec['url']}: {e}")
+                continue
+            if note and not note.upper().startswith("IRRELEVANT"):
+                notes.append(f"- {rec.get('title') or ''} <{rec['url']}>\n{note}")
+        summaries = "".join(show(reduce_summaries(user_brief, notes, stream=True)))
+        ck.put("summaries", summaries)
+    else:
+        summaries = "".join(show(step_4(user_brief, compactify(research_pack, user_brief), stream=True)))
+        ck.put("summaries", summaries)
+    llm.shutdown()
+    # Start checking the summaries' links now; the draft mostly reuses them.
+    check_urls(extract_refs(summaries))
+
+    # (5)-(6)-(7) Draft
+    out("\n=== (5)-(6)-(7): Draft, Provisional bibliography, Limitations & Next Checks ===\n")
+    # One unit per outline section; only units whose heading or routed sources changed are rewritten.
+    units, previous = plan_units(user_brief, outline, summaries), ck.get("draft_units")
+    draft = ck.get("draft")
+    if draft is not None and (not units or previous is None or
+                              [u["key"] for u in previous] == [u["key"] for u in units]):
+        out(draft)
+    elif units:
+        draft = "".join(show(write_units(units, previous, LLM_PARALLEL)))
+        ck.put("draft", draft)
+        ck.put("draft_units", unit_manifest(units))
+        kept = {u["key"] for u in previous or ()}
+        out(f"[INFO] Draft: {sum(u['key'] not in kept for u in units)} of {len(units)} units written, the rest reused")
+    else:
+        draft = "".join(show(step_5_6_7(user_brief, outline, summaries, stream=True)))
+        ck.put("draft", draft)
+
+    # Verify every URL/DOI concurrently; dead links and links absent from the sources get [VERIFY]
+    known = extract_refs(summaries) + [r["url"] for r in research_pack]
+    draft, flagged = verify_citations(draft, known)
+    summaries, dead = verify_citations(summaries)
+    out(f"\n[INFO] Citations checked: {len(extract_refs(draft))} in draft, "
+        f"{len(flagged)} flagged, {len(dead)} dead in summaries")
+    for url, reason in dict.fromkeys(flagged + dead):
+        out(f"  [VERIFY] {url} — {reason}")
+
+    say("Draft complete. I included limitations and next checks.")
+    return {"outline": outline, "queries": queries, "research_pack": research_pack,
+            "summaries": summaries, "draft": draft, "flagged": list(dict.fromkeys(flagged + dead))}
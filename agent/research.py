@@ -0,0 +1,146 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import dedup
+from .tools import web_search, fetch_and_clean
+from .transport import HostQueue
+
+MAX_IN_FLIGHT = int(os.getenv("FETCH_MAX_IN_FLIGHT", "16"))
+PER_HOST      = int(os.getenv("FETCH_PER_HOST", "2"))
+
+# ----- Concurrent search + fetch -----
+class ResearchPack:
+    """
+    Fans out web_search for every query and fetch_and_clean for every hit on a
+    bounded thread pool. At most `max_in_flight` requests run at once and at
+    most `per_host` of them hit the same host; a fetch for a host at its cap
+    waits in that host's queue, not in a worker. Records keep the serial
+    order (query order, then hit order) regardless of which fetch finishes
+    first.
+    `on_record(rec)` is called from the fetch thread as soon as a record lands.
+
+    Every document is fetched and counted once: hits are keyed by their
+    canonical URL (tracking params stripped, known redirectors resolved) and
+    later hits for the same key are dropped before fetching; fetched texts
+    that are SimHash near-duplicates of an earlier record (syndicated copies,
+    mirrors) get `duplicate_of` set and are left out of records().
+
+    With a `store` (agent/packstore.py) each kept record is appended to disk
+    as soon as it is fetched and replaced by its Record view, so page texts
+    don't stay resident while the pack grows.
+    """
+
+    def __init__(self, k=6, max_in_flight=MAX_IN_FLIGHT, per_host=PER_HOST, on_record=None, store=None):
+        self.k = k
+        self.on_record = on_record
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="fetch")
+        self._lock = threading.Lock()
+        self._hosts = HostQueue(per_host, lambda fn: self._track(self._pool.submit(fn)))
+        self._futures = []
+        self._queries = []
+        self._slots = []
+        self._urls = set()
+        self._near = dedup.NearDupIndex()
+        self.stats = {"hits": 0, "same_url": 0, "near_dup": 0}
+
+    def _track(self, fut):
+        with self._lock:
+            self._futures.append(fut)
+
+    def submit(self, q):
+        with self._lock:
+            if q in self._queries:
+                return
+            idx = len(self._queries)
+            self._queries.append(q)
+            self._slots.append([])
+        self._track(self._pool.submit(self._search, idx, q))
+
+    def _search(self, idx, q):
+        try:
+            hits = web_search(q, k=self.k)
+        except Exception as e:
+            print(f"[WARN] search failed for {q!r}: {e}")
+            hits = []
+        recs = []
+        for h in hits:
+            if not h.get("url"):
+                continue
+            with self._lock:
+                self.stats["hits"] += 1
+            url = dedup.strip_tracking(h["url"])
+            if not self._claim(dedup.canonical_url(url)):
+                continue
+            recs.append({
+                "query": q,
+                "title": h.get("title"),
+                "url": url,
+                "text": None,
+                "snippet": h.get("content") or h.get("snippet")
+            })
+        self._slots[idx] = recs
+        for j, rec in enumerate(recs):
+            self._track(self._pool.submit(self._fetch, rec, idx, j))
+
+    def _claim(self, canon):
+        """True the first time a canonical URL is seen."""
+        with self._lock:
+            if canon in self._urls:
+                self.stats["same_url"] += 1
+                return False
+            self._urls.add(canon)
+            return True
+
+    def _fetch(self, rec, idx, j):
+        url = rec["url"]
+        if dedup.needs_resolve(url):
+            final = dedup.resolve(url)
+            if final != url:
+                if not self._claim(dedup.canonical_url(final)):
+                    rec["duplicate_of"] = final
+                    return
+                url = final
+        self._hosts.run(url, lambda: self._land(rec, url, idx, j))
+
+    def _land(self, rec, url, idx, j):
+        rec["text"] = fetch_and_clean(url)
+        other = self._near.add(rec["url"], rec["text"])
+        if other:
+            rec["duplicate_of"] = other
+            with self._lock:
+                self.stats["near_dup"] += 1
+            if self.store is not None:
+                rec["text"] = None
+            return
+        if self.store is not None:
+            rec = self._slots[idx][j] = self.store.append(rec)
+        if self.on_record:
+            try:
+                self.on_record(rec)
+            except Exception as e:
+                print(f"[WARN] on_record failed for {rec['url']}: {e}")
+
+    def records(self):
+        """Block until every search and fetch submitted so far has finished."""
+        while True:
+            with self._lock:
+                pending = [f for f in self._futures if not f.done()]
+            if not pending:
+                break
+            wait(pending)
+        return [r for recs in self._slots for r in recs if "duplicate_of" not in r]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def build_research_pack(queries, k=6, max_in_flight=MAX_IN_FLIGHT, per_host=PER_HOST):
+    with ResearchPack(k=k, max_in_flight=max_in_flight, per_host=per_host) as pack:
+        for q in queries:
+            pack.submit(q)
+        return pack.records()
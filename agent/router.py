@@ -1,39 +1,153 @@
-import json, shlex
-from apscheduler.schedulers.background import BackgroundScheduler
+import os, json, shlex, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .tools import web_search, fetch_and_clean, read_pdf, rag_recall
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+# ----- Scheduled jobs (persisted in SQLite, so they survive a restart) -----
+JOBS_DB = os.getenv("JOBS_DB", "data/jobs.sqlite")
+MISFIRE_GRACE = int(os.getenv("JOBS_MISFIRE_GRACE", "3600"))   # still run jobs missed by up to an hour while offline
+
+# The scheduler (and APScheduler itself) is only started when a `schedule` call arrives
+# or resume_jobs() finds a job store from an earlier run.
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            try:
+                from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+                os.makedirs(os.path.dirname(JOBS_DB) or ".", exist_ok=True)
+                stores = {"default": SQLAlchemyJobStore(url=f"sqlite:///{os.path.abspath(JOBS_DB)}")}
+            except ImportError:
+                print("[WARN] SQLAlchemy not installed; scheduled jobs are kept in memory only")
+                stores = {}
+            _scheduler = BackgroundScheduler(jobstores=stores,
+                                             job_defaults={"misfire_grace_time": MISFIRE_GRACE, "coalesce": True})
+            _scheduler.start()
+    return _scheduler
+
+def resume_jobs():
+    """Start the scheduler if an earlier run left persisted jobs."""
+    if os.path.exists(JOBS_DB):
+        get_scheduler()
+
+def remind(title, note=""):
+    # Module-level so the job store can pickle a reference to it (a lambda can't be persisted).
+    print(f"[TASK] {title}: {note}")
 
 ALLOWED_CMDS = ["dir", "type", "echo", "ipconfig"]  # expand with care
 
 def try_json(msg_text):
+    """Parse a tool call ({...}) or a batch of them ([{...}, ...]); None if the text isn't one."""
     msg_text = msg_text.strip()
-    if msg_text.startswith("{") and msg_text.endswith("}"):
-        try: return json.loads(msg_text)
+    if (msg_text.startswith("{") and msg_text.endswith("}")) or (msg_text.startswith("[") and msg_text.endswith("]")):
+        try: obj = json.loads(msg_text)
         except: return None
+        if isinstance(obj, list) and not all(isinstance(c, dict) for c in obj):
+            return None
+        return obj
     return None
 
+# ----- Tools -----
+def _schedule(a):
+    title = a.get("title", "Task")
+    get_scheduler().add_job(remind, "date", run_date=a.get("when"), args=[title, a.get("note", "")],
+                            id=f"{title}@{a.get('when')}", replace_existing=True)
+    return f"Scheduled {title} at {a.get('when')}"
+
+def _shell(a):
+    cmd = a.get("command","")
+    if not cmd: raise ValueError("Missing command")
+    exe = shlex.split(cmd)[0].lower()
+    if exe not in ALLOWED_CMDS:
+        raise ValueError("Command not allowed")
+    # We don't run it here—ask user to confirm first.
+    return f"[CONFIRM_REQUIRED] {cmd}"
+
+# name: (handler, deadline in seconds, max concurrent calls)
+TOOLS = {
+    "web_search": (lambda a: web_search(a.get("q",""), a.get("k",5)), 20, 4),
+    "web_fetch":  (lambda a: fetch_and_clean(a.get("url","")), 30, 8),
+    "read_pdf":   (lambda a: read_pdf(a.get("path",""), a.get("max_pages",10)), 60, 2),
+    "rag_recall": (lambda a: rag_recall(a.get("query",""), a.get("k",4)), 20, 2),
+    "schedule":   (_schedule, 10, 1),
+    "shell":      (_shell, 5, 1),
+}
+TOOL_MAX_RESULT = int(os.getenv("TOOL_MAX_RESULT", "20000"))   # characters of JSON per result
+TOOL_WORKERS    = int(os.getenv("TOOL_WORKERS", "16"))
+
+_pool = None
+_slots = {name: threading.BoundedSemaphore(limit) for name, (_, _, limit) in TOOLS.items()}
+
+def _cap(result, limit=TOOL_MAX_RESULT):
+    """Shrink a result to about `limit` characters of JSON; returns (result, truncated)."""
+    size = len(json.dumps(result, ensure_ascii=False, default=str))
+    if size <= limit:
+        return result, False
+    if isinstance(result, str):
+        return result[:limit] + f"\n[... {len(result) - limit} more characters]", True
+    if isinstance(result, list):
+        kept, used = [], 2
+        for item in result:
+            item, _ = _cap(item, max(0, limit - used))
+            used += len(json.dumps(item, ensure_ascii=False, default=str)) + 1
+            if used > limit and kept:
+                break
+            kept.append(item)
+        return kept, True
+    if isinstance(result, dict):
+        return {k: _cap(v, limit // max(1, len(result)))[0] for k, v in result.items()}, True
+    return str(result)[:limit], True
+
+def _call(name, args):
+    handler, _, _ = TOOLS[name]
+    with _slots[name]:
+        return handler(args)
+
+def run_tools(calls):
+    """
+    Run a batch of tool calls ({"tool", "args", optional "id"}) concurrently and
+    yield one response per call as soon as it finishes, in completion order.
+    Each tool has its own deadline and concurrency limit; a call that misses
+    its deadline is reported as timed out (its thread finishes in the
+    background and the late result is dropped).
+    """
+    global _pool
+    if isinstance(calls, dict):
+        calls = [calls]
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+    start = time.time()
+    pending, unknown = {}, []
+    # Submit everything before yielding anything: deadlines run from `start`, whatever the consumer does.
+    for i, obj in enumerate(calls):
+        name = obj.get("tool")
+        head = {"id": obj.get("id", i), "tool": name}
+        if name not in TOOLS:
+            unknown.append(head)
+            continue
+        fut = _pool.submit(_call, name, obj.get("args") or {})
+        pending[fut] = (head, start + TOOLS[name][1])
+    for head in unknown:
+        yield dict(head, ok=False, error="Unknown tool")
+    while pending:
+        next_deadline = min(d for _, d in pending.values())
+        done, _ = wait(pending, timeout=max(0.0, next_deadline - time.time()), return_when=FIRST_COMPLETED)
+        for fut in done:
+            head, _ = pending.pop(fut)
+            try:
+                result, truncated = _cap(fut.result())
+                yield dict(head, ok=True, result=result, **({"truncated": True} if truncated else {}))
+            except Exception as e:
+                yield dict(head, ok=False, error=str(e))
+        now = time.time()
+        for fut, (head, deadline) in list(pending.items()):
+            if now >= deadline and not fut.done():
+                fut.cancel()
+                del pending[fut]
+                yield dict(head, ok=False, error=f"timed out after {TOOLS[head['tool']][1]}s")
+
 def run_tool(obj):
-    t = obj.get("tool"); a = obj.get("args",{})
-    if t == "web_search":
-        return {"ok": True, "result": web_search(a.get("q",""), a.get("k",5))}
-    if t == "web_fetch":
-        return {"ok": True, "result": fetch_and_clean(a.get("url",""))}
-    if t == "read_pdf":
-        return {"ok": True, "result": read_pdf(a.get("path",""), a.get("max_pages",10))}
-    if t == "rag_recall":
-        return {"ok": True, "result": rag_recall(a.get("query",""), a.get("k",4))}
-    if t == "schedule":
-        scheduler.add_job(lambda: print(f"[TASK] {a.get('title','Task')}: {a.get('note','')}"),
-                          'date', run_date=a.get("when"))
-        return {"ok": True, "result": f"Scheduled {a.get('title','Task')} at {a.get('when')}"}
-    if t == "shell":
-        cmd = a.get("command","")
-        if not cmd: return {"ok": False, "error":"Missing command"}
-        exe = shlex.split(cmd)[0].lower()
-        if exe not in ALLOWED_CMDS:
-            return {"ok": False, "error":"Command not allowed"}
-        # We don't run it here—ask user to confirm first.
-        return {"ok": True, "result": f"[CONFIRM_REQUIRED] {cmd}"}
-    return {"ok": False, "error":"Unknown tool"}
+    return next(run_tools([obj]))
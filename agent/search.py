@@ -0,0 +1,220 @@
+"""
+Search backends behind web_search.
+
+    SEARCH_BACKENDS=tavily,local      # default; tavily is skipped without TAVILY_API_KEY
+    SEARCH_BACKENDS=local             # fully offline: cached pages + data/user_docs
+    SEARCH_BACKENDS=fixture SEARCH_FIXTURES=bench/fixtures/search.json   # deterministic
+
+Backends run in parallel, each on its own threads and with its own deadline;
+a slow one is simply left out of the merge. Hits are interleaved by rank in
+SEARCH_BACKENDS order and deduplicated by canonical URL. A backend is any
+object with `name`, `deadline`, `available()` and `search(q, k)` returning
+[{"title","url","snippet"}]; an optional `warm()` starts slow setup in the
+background (search.warm() calls it at startup, and search() never waits for
+it). Add one with register().
+"""
+import os, json, time, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from . import cache, dedup, fts, pdf, transport
+from .context import best_span
+
+SEARCH_BACKENDS = os.getenv("SEARCH_BACKENDS", "tavily,local")
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "10"))   # seconds per remote backend
+SEARCH_TTL      = int(os.getenv("SEARCH_TTL", str(24 * 3600)))
+TAVILY_KEY      = os.getenv("TAVILY_API_KEY")
+USER_DOCS       = os.getenv("USER_DOCS", "data/user_docs")
+SEARCH_FIXTURES = os.getenv("SEARCH_FIXTURES", "")
+SNIPPET_CHARS   = 300
+
+# ----- Backends -----
+class TavilyBackend:
+    name = "tavily"
+    deadline = SEARCH_DEADLINE
+
+    def available(self):
+        return bool(TAVILY_KEY)
+
+    def search(self, q, k):
+        source = f"{k}:{cache.normalize_query(q)}"
+        hit = cache.get_json("search", source, ttl=SEARCH_TTL)
+        if hit is not None:
+            return hit
+        r = transport.post("https://api.tavily.com/search", json={
+            "api_key": TAVILY_KEY, "query": q, "max_results": k
+        }, read_timeout=self.deadline)
+        r.raise_for_status()
+        data = r.json().get("results", [])
+        out = [{"title": i.get("title"), "url": i.get("url"), "snippet": i.get("content")} for i in data]
+        cache.put_json("search", source, out)
+        return out
+
+class LocalBackend:
+    """BM25 over every page fetch_and_clean has stored plus the files in USER_DOCS (fts table "pages")."""
+    name = "local"
+    deadline = 3.0
+
+    def __init__(self, folder=USER_DOCS):
+        self.folder = folder
+        self._sync_thread = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return True
+
+    def sync(self):
+        """Index cached pages once (if the table is empty) and bring USER_DOCS up to date."""
+        if not fts.count("pages"):
+            rows = [(cache.normalize_url(src), src, _title(text), text)
+                    for src, text in cache.rows("page") if not text.startswith("[ERROR")]
+            fts.upsert(rows, table="pages")
+        seen = set()
+        for root, _, names in os.walk(self.folder):
+            for name in sorted(names):
+                try:
+                    path = local_path(Path(os.path.abspath(os.path.join(root, name))).as_uri())
+                except PermissionError:
+                    continue   # not a document, or a symlink out of the folder
+                url = Path(path).as_uri()
+                seen.add(url)
+                st = os.stat(path)
+                stamp = f"{st.st_mtime_ns}:{st.st_size}"
+                row = cache.get("userdoc", url)
+                if row and row["value"] == stamp:
+                    continue
+                fts.delete_path(url, table="pages")
+                fts.upsert([(f"{url}#{n}", url, f"{name} p.{n}" if n else name, text)
+                            for n, text in doc_pages(path) if text.strip()], table="pages")
+                cache.put("userdoc", url, stamp)
+        for url in fts.paths("file://", table="pages") - seen:
+            fts.delete_path(url, table="pages")
+
+    def warm(self):
+        """Start the one-off sync in the background; searches meanwhile see what is indexed so far."""
+        with self._lock:
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._sync_logged, daemon=True, name="local-sync")
+                self._sync_thread.start()
+
+    def _sync_logged(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"[WARN] local index sync failed: {e}")
+
+    def search(self, q, k):
+        self.warm()
+        out, urls = [], set()
+        for r in fts.search(q, k=k * 4, table="pages"):
+            if r["path"] in urls:
+                continue   # best page of each document only
+            urls.add(r["path"])
+            out.append({"title": r["page"], "url": r["path"], "snippet": best_span(r["text"], q, SNIPPET_CHARS)})
+            if len(out) == k:
+                break
+        return out
+
+class FixtureBackend:
+    """Canned hits from SEARCH_FIXTURES ({query: [hits]}, "*" for any other query); for benchmarks and tests."""
+    name = "fixture"
+    deadline = 1.0
+
+    def __init__(self, path=SEARCH_FIXTURES):
+        self.path = path
+        self._data = None
+
+    def available(self):
+        return bool(self.path) and os.path.exists(self.path)
+
+    def search(self, q, k):
+        if self._data is None:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                self._data = {cache.normalize_query(key): hits for key, hits in json.load(fh).items()}
+        return list(self._data.get(cache.normalize_query(q), self._data.get("*", [])))[:k]
+
+BACKENDS = {}
+
+def register(backend):
+    BACKENDS[backend.name] = backend
+
+for _b in (TavilyBackend(), LocalBackend(), FixtureBackend()):
+    register(_b)
+
+# ----- Local documents -----
+def _title(text):
+    line = next((l.strip() for l in text.splitlines() if l.strip()), "")
+    return line[:120]
+
+def doc_pages(path, max_pages=None):
+    """(page, text) for a local .pdf/.txt/.md file; page 0 for formats without pages."""
+    if path.lower().endswith(".pdf"):
+        for p in pdf.iter_pages(path, max_pages=max_pages):
+            yield p["page"], p["text"]
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+            yield 0, fh.read()
+
+def local_path(url):
+    """The file behind a file:// hit; only files under USER_DOCS are served (PermissionError otherwise)."""
+    from urllib.parse import urlsplit
+    from urllib.request import url2pathname
+    path = os.path.realpath(url2pathname(urlsplit(url).path))
+    root = os.path.realpath(USER_DOCS)
+    if os.path.commonpath([path, root]) != root or not path.lower().endswith((".pdf", ".txt", ".md")):
+        raise PermissionError("not a document under USER_DOCS")
+    return path
+
+def index_page(url, text):
+    """Make a freshly fetched page searchable by the local backend."""
+    if text and not text.startswith("[ERROR"):
+        fts.upsert([(cache.normalize_url(url), url, _title(text), text)], table="pages")
+
+# ----- Merge -----
+SEARCH_WORKERS = 4   # threads per backend; each backend has its own, so a stuck one can't starve the rest
+_pools = {}
+_pool_lock = threading.Lock()
+
+def active():
+    names = [n.strip() for n in SEARCH_BACKENDS.split(",") if n.strip()]
+    return [BACKENDS[n] for n in names if n in BACKENDS and BACKENDS[n].available()]
+
+def warm():
+    """Start the active backends' background work (the local index sync) ahead of the first query."""
+    for b in active():
+        if hasattr(b, "warm"):
+            b.warm()
+
+def _pool(backend):
+    with _pool_lock:
+        if backend.name not in _pools:
+            _pools[backend.name] = ThreadPoolExecutor(max_workers=SEARCH_WORKERS,
+                                                      thread_name_prefix=f"search-{backend.name}")
+        return _pools[backend.name]
+
+def search(q, k=5, backends=None):
+    """Query every backend concurrently; merge what arrives within each backend's deadline."""
+    backends = active() if backends is None else backends
+    if not backends:
+        return []
+    start = time.time()
+    futs = [(b, _pool(b).submit(b.search, q, k)) for b in backends]
+    ranked = []
+    for b, fut in futs:
+        try:
+            hits = fut.result(timeout=max(0.0, start + b.deadline - time.time()))
+        except TimeoutError:
+            print(f"[WARN] {b.name} search missed its {b.deadline:g}s deadline for {q!r}")
+            continue
+        except Exception as e:
+            print(f"[WARN] {b.name} search failed for {q!r}: {e}")
+            continue
+        ranked.append([dict(h, backend=b.name) for h in hits if h.get("url")])
+    out, seen = [], set()
+    for rank in range(max((len(r) for r in ranked), default=0)):
+        for hits in ranked:
+            if rank < len(hits):
+                key = dedup.canonical_url(hits[rank]["url"])
+                if key not in seen:
+                    seen.add(key)
+                    out.append(hits[rank])
+    return out[:k]
@@ -1,117 +1,505 @@
-import os, re, json, time, requests
-from readability import Document
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer
-import chromadb
-
-load_dotenv()
-OLLAMA_URL   = os.getenv("OLLAMA_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
-TAVILY_KEY   = os.getenv("TAVILY_API_KEY")
-
-# ----- LLM -----
-def llm_chat(messages, temperature=0.2):
-    resp = requests.post(f"{OLLAMA_URL}/api/chat", json={
-        "model": OLLAMA_MODEL,
+import os, re, json, time, threading
+from . import cache, citations, fts, memd, ollama, pdf, search, trace, transport
+from .context import best_span
+
+# Heavy dependencies (lxml, readability/bs4, sentence_transformers, chromadb, pypdf)
+# are imported on first use so `import agent.tools` stays cheap.
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")   # endpoints: OLLAMA_URL(S), see agent/ollama.py
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))  # prompts are packed to fit (agent/context.py)
+
+# ----- Model routing: each step runs on a tier, each tier is a model -----
+MODEL_TIERS = {
+    "small": os.getenv("OLLAMA_MODEL_SMALL", OLLAMA_MODEL),
+    "large": os.getenv("OLLAMA_MODEL_LARGE", OLLAMA_MODEL),
+}
+# Extraction and per-source summaries are cheap; the draft gets the big model.
+# Override with e.g. LLM_STEP_TIERS="step_1_2_3=large,step_4=qwen2.5:3b" (a tier or a model name).
+STEP_TIERS = {
+    "step_1_2_3": "small", "summarize_source": "small", "reduce_summaries": "small",
+    "step_4": "small", "step_5_6_7": "large",
+}
+STEP_TIERS.update(dict(item.split("=", 1) for item in os.getenv("LLM_STEP_TIERS", "").split(",") if "=" in item))
+
+def model_for(step):
+    tier = STEP_TIERS.get(step, "large")
+    return MODEL_TIERS.get(tier, tier)
+
+# ----- LLM (memoized on model + messages + options, see agent/cache.py) -----
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")   # keep weights + prompt cache loaded between steps
+LLM_CACHE     = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+def _chat_payload(messages, temperature, stream, model=None):
+    return {
+        "model": model or OLLAMA_MODEL,
         "messages": messages,
-        "options": {"temperature": temperature},
-        "stream": False
-    }, timeout=180)
-    resp.raise_for_status()
-    return resp.json()["message"]["content"]
+        "options": {"temperature": temperature, "num_ctx": OLLAMA_NUM_CTX},
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "stream": stream
+    }
+
+def _memo_key(payload):
+    return json.dumps({k: payload[k] for k in ("model", "messages", "options")},
+                      sort_keys=True, ensure_ascii=False)
 
-# ----- Web search & fetch -----
+def llm_chat(messages, temperature=0.2, memo=True, model=None):
+    payload = _chat_payload(messages, temperature, False, model)
+    key = _memo_key(payload)
+    with trace.span("llm", model=payload["model"], prompt_chars=sum(len(m["content"]) for m in messages)) as sp:
+        if memo and LLM_CACHE:
+            hit = cache.get_json("llm", key, ttl=LLM_CACHE_TTL)
+            if hit is not None:
+                sp.set(memo=True)
+                return hit
+        with ollama.endpoint(payload["model"]) as ep:
+            sp.set(endpoint=ep.url, queued_ms=round((time.perf_counter() - sp._t0) * 1000, 1))
+            resp = transport.post(f"{ep.url}/api/chat", json=payload,
+                                  read_timeout=transport.LLM_READ_TIMEOUT)
+            resp.raise_for_status()
+            data = resp.json()
+        trace.llm_stats(sp, data)
+        content = data["message"]["content"]
+    if memo and LLM_CACHE:
+        cache.put_json("llm", key, content)
+    return content
+
+def llm_stream(messages, temperature=0.2, stop=None, memo=True, model=None):
+    """
+    Yield content chunks as Ollama generates them. If `stop(text_so_far)`
+    returns True the connection is closed, which cancels generation server-side.
+    A memoized reply is replayed as one chunk; only complete replies are stored.
+    The endpoint slot (agent/ollama.py) is held until the stream ends.
+    """
+    payload = _chat_payload(messages, temperature, True, model)
+    key = _memo_key(payload)
+    with trace.span("llm", model=payload["model"], stream=True,
+                    prompt_chars=sum(len(m["content"]) for m in messages)) as sp:
+        if memo and LLM_CACHE:
+            hit = cache.get_json("llm", key, ttl=LLM_CACHE_TTL)
+            if hit is not None:
+                sp.set(memo=True)
+                yield hit
+                return
+        with ollama.endpoint(payload["model"]) as ep, \
+                transport.post(f"{ep.url}/api/chat", json=payload,
+                               stream=True, read_timeout=transport.LLM_READ_TIMEOUT) as resp:
+            sp.set(endpoint=ep.url)
+            resp.raise_for_status()
+            text = ""
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                part = json.loads(line)
+                chunk = part.get("message", {}).get("content", "")
+                if chunk:
+                    if not text:
+                        sp.set(first_token_ms=round((time.perf_counter() - sp._t0) * 1000, 1))
+                    text += chunk
+                    yield chunk
+                    if stop and stop(text):
+                        sp.set(stopped=True)
+                        return
+                if part.get("done"):
+                    trace.llm_stats(sp, part)
+                    break
+    if memo and LLM_CACHE:
+        cache.put_json("llm", key, text)
+
+# ----- Web search & fetch (cached in data/cache, see agent/cache.py) -----
 def web_search(q, k=5):
-    if not TAVILY_KEY:
-        return []
-    r = requests.post("https://api.tavily.com/search", json={
-        "api_key": TAVILY_KEY, "query": q, "max_results": k
-    }, timeout=60)
-    r.raise_for_status()
-    data = r.json().get("results", [])
-    return [{"title": i.get("title"), "url": i.get("url"), "snippet": i.get("content")} for i in data]
+    """Merged hits from the SEARCH_BACKENDS (Tavily, local index, fixtures; see agent/search.py)."""
+    with trace.span("web_search", q=q) as sp:
+        hits = search.search(q, k)
+        sp.set(hits=len(hits))
+    return hits
+
+FETCH_MAX_BYTES     = int(os.getenv("FETCH_MAX_BYTES", str(3 << 20)))       # HTML/text bodies are cut here
+FETCH_MAX_PDF_BYTES = int(os.getenv("FETCH_MAX_PDF_BYTES", str(30 << 20)))  # PDFs can't be cut; larger ones are skipped
+FETCH_PDF_PAGES     = int(os.getenv("FETCH_PDF_PAGES", "30"))
+HTML_BACKEND  = os.getenv("HTML_BACKEND", "lxml")     # "lxml" (fast) or "readability" (readability + bs4)
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "0"))  # >0 cleans HTML in a process pool
+
+_DROP_TAGS = ("script", "style", "noscript", "template", "svg", "canvas", "iframe", "button",
+              "nav", "header", "footer", "aside", "menu", "dialog")
+_BLOCK_TAGS = ("p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "br", "pre",
+               "blockquote", "figcaption", "dd", "dt", "h1", "h2", "h3", "h4", "h5", "h6")
+# A whole class/id token such as "sidebar", "share-buttons" or "cookie_banner"; not "social-share-enabled".
+_BOILERPLATE = re.compile(r"(cookies?|consent|banner|newsletter|subscribe|share|sharing|social|related|comments?|"
+                          r"advert|ads?|promo|sidebar|breadcrumbs?|popup|modal)"
+                          r"([-_](bar|banner|consent|box|buttons?|links?|list|widget|wrap|wrapper|container|"
+                          r"section|area|block|notice|form|posts?|items?))?", re.I)
+CLEAN_MIN_CHARS = 200   # an lxml result shorter than this is retried with readability
+
+def _clean_lxml(html):
+    import lxml.html
+    from lxml import etree
+    try:
+        doc = lxml.html.fromstring(html)
+    except ValueError:   # str with an XML encoding declaration
+        doc = lxml.html.fromstring(html.encode("utf-8"))
+    etree.strip_elements(doc, etree.Comment, *_DROP_TAGS, with_tail=False)
+    for el in doc.xpath("//*[@class or @id or @role or @aria-hidden]"):
+        parent = el.getparent()
+        if parent is None or el.tag in ("html", "body", "article", "main"):
+            continue
+        tokens = f"{el.get('class', '')} {el.get('id', '')}".split()
+        if (el.get("aria-hidden") == "true" or el.get("role") in ("navigation", "banner", "contentinfo")
+                or any(_BOILERPLATE.fullmatch(t) for t in tokens)):
+            # A wrapper that holds most of its parent's text is content, whatever its classes say.
+            if len(el.text_content()) <= 0.5 * len(parent.text_content()):
+                el.drop_tree()
+    # Prefer the main article when the page marks one and it carries most of the text.
+    body = doc.find("body") if doc.find("body") is not None else doc
+    root = body
+    for cand in doc.xpath("//article | //main | //*[@role='main']"):
+        if len(cand.text_content()) > 0.4 * len(body.text_content()):
+            root = cand
+            break
+    for el in root.iter(*_BLOCK_TAGS):
+        el.tail = "\n" + (el.tail or "")
+    lines = (" ".join(line.split()) for line in root.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def _clean_readability(html):
+    from readability import Document
+    from bs4 import BeautifulSoup
+    doc = Document(html)
+    return BeautifulSoup(doc.summary(), "html.parser").get_text("\n")
+
+def clean_html(html, backend=None):
+    backend = backend or HTML_BACKEND
+    if backend == "readability":
+        return _clean_readability(html)
+    text = _clean_lxml(html)
+    if len(text) < CLEAN_MIN_CHARS:
+        try:   # the heuristics cut too much (or the page is a stub); readability gets a second look
+            alt = _clean_readability(html)
+        except Exception:   # not installed, or it can't parse the page either
+            return text
+        text = alt if len(alt.strip()) > len(text) else text
+    return text
+
+_clean_pool = None
+_clean_lock = threading.Lock()
+
+def _clean(html):
+    global _clean_pool
+    with trace.span("clean_html", backend=HTML_BACKEND, chars=len(html)):
+        if CLEAN_WORKERS <= 0:
+            return clean_html(html)
+        with _clean_lock:
+            if _clean_pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                _clean_pool = ProcessPoolExecutor(max_workers=CLEAN_WORKERS)
+        return _clean_pool.submit(clean_html, html, HTML_BACKEND).result()
+
+def _download(r, cap):
+    """Read at most `cap` bytes of a streamed response; returns (body, truncated)."""
+    buf, size = [], 0
+    for block in r.iter_content(64 * 1024):
+        buf.append(block)
+        size += len(block)
+        trace.current().add("bytes", len(block))
+        trace.count("fetch_bytes", len(block))
+        if size >= cap:
+            return b"".join(buf)[:cap], True
+    return b"".join(buf), False
+
+def _decode(data, ct):
+    m = re.search(r"charset=([\w.:-]+)", ct, re.I) or re.search(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", data[:4096], re.I)
+    enc = m.group(1) if m else "utf-8"
+    enc = enc.decode("ascii", "replace") if isinstance(enc, bytes) else enc
+    try:
+        return data.decode(enc, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+def _pdf_text(data):
+    pages = pdf.iter_pages(bytes(data), max_pages=FETCH_PDF_PAGES, workers=1)
+    return "\n\n".join(f"[page {p['page']}]\n{p['text'].strip()}" for p in pages)
+
+def _page_text(url, r):
+    """Route a streamed response by content type; memory stays within the byte caps."""
+    ct = r.headers.get("Content-Type", "").lower()
+    is_pdf = "application/pdf" in ct or (not ct.startswith("text/") and url.lower().split("?")[0].endswith(".pdf"))
+    if is_pdf:
+        size = int(r.headers.get("Content-Length") or 0)
+        if size > FETCH_MAX_PDF_BYTES:
+            raise ValueError(f"PDF too large ({size} bytes)")
+        data, cut = _download(r, FETCH_MAX_PDF_BYTES)
+        if cut:
+            raise ValueError(f"PDF larger than {FETCH_MAX_PDF_BYTES} bytes")
+        return _pdf_text(data)
+    if ct and not (ct.startswith("text/") or "html" in ct or "xml" in ct or "json" in ct):
+        raise ValueError(f"unsupported content type {ct.split(';')[0]}")
+    data, _ = _download(r, FETCH_MAX_BYTES)
+    if data[:5] == b"%PDF-":
+        raise ValueError("PDF served as text (no content type)")
+    text = _decode(data, ct)
+    if "html" in ct or (not ct and "<html" in text[:2048].lower()):
+        return _clean(text)
+    return text
+
+def _local_text(url):
+    path = search.local_path(url)
+    pages = list(search.doc_pages(path, max_pages=FETCH_PDF_PAGES))
+    if len(pages) == 1 and pages[0][0] == 0:
+        return pages[0][1]
+    return "\n\n".join(f"[page {n}]\n{text.strip()}" for n, text in pages)
 
 def fetch_and_clean(url, max_chars=20000):
+    with trace.span("fetch_and_clean", url=url) as sp:
+        text = _fetch_and_clean(url, max_chars, sp)
+        sp.set(chars=len(text))
+        if text.startswith("[ERROR"):
+            sp.set(error=text[:200])
+        return text
+
+def _fetch_and_clean(url, max_chars, sp):
+    # Local documents (file:// hits from the local search backend) are read in place.
+    if url.startswith("file://"):
+        sp.set(cache="local")
+        try:
+            return _local_text(url)[:max_chars]
+        except Exception as e:
+            return f"[ERROR reading {url}: {e}]"
+    # The cache stores the cleaned text, so a hit (or a 304) skips download and parsing.
+    source = cache.normalize_url(url)
+    row = cache.get("page", source)
+    if cache.is_fresh(row):
+        sp.set(cache="fresh")
+        return row["value"][:max_chars]
+    sp.set(cache="stale" if row else "miss")
+    headers = {}
+    if row and row["etag"]:
+        headers["If-None-Match"] = row["etag"]
+    if row and row["last_modified"]:
+        headers["If-Modified-Since"] = row["last_modified"]
     try:
-        r = requests.get(url, timeout=60, headers={"User-Agent":"Mozilla/5.0"})
-        r.raise_for_status()
-        ct = r.headers.get("Content-Type","")
-        if "text/html" in ct:
-            doc = Document(r.text)
-            html = doc.summary()
-            text = BeautifulSoup(html, "html.parser").get_text("\n")
-        else:
-            text = r.text
+        with transport.get(url, headers=headers, stream=True) as r:
+            if r.status_code == 304 and row:
+                sp.set(cache="revalidated")
+                cache.revalidated("page", source)
+                return row["value"][:max_chars]
+            r.raise_for_status()
+            sp.set(content_type=r.headers.get("Content-Type", "").split(";")[0])
+            text = _page_text(url, r)
         text = re.sub(r"\n{3,}", "\n\n", text)
+        if not text.strip():
+            return f"[ERROR fetching {url}: no text extracted]"   # not cached; the next fetch tries again
+        cache.put("page", source, text, etag=r.headers.get("ETag"),
+                  last_modified=r.headers.get("Last-Modified"))
+        search.index_page(url, text)
         return text[:max_chars]
     except Exception as e:
+        if row:
+            return row["value"][:max_chars]   # stale beats nothing when offline
         return f"[ERROR fetching {url}: {e}]"
 
-# ----- PDF read (page text with page numbers) -----
+# ----- PDF read (page text with page numbers; parallel + cached in agent/pdf.py) -----
 def read_pdf(path, max_pages=10):
-    out = []
-    try:
-        reader = PdfReader(path)
-        pages = min(len(reader.pages), max_pages)
-        for i in range(pages):
-            out.append({"page": i+1, "text": reader.pages[i].extract_text() or ""})
-    except Exception as e:
-        return [{"page": 0, "text": f"[ERROR reading PDF: {e}]"}]
-    return out
+    with trace.span("read_pdf", path=path) as sp:
+        try:
+            pages = list(pdf.iter_pages(path, max_pages=max_pages))
+            sp.set(pages=len(pages))
+            return pages
+        except Exception as e:
+            sp.set(error=str(e))
+            return [{"page": 0, "text": f"[ERROR reading PDF: {e}]"}]
 
 # ----- Simple citation checks -----
 def url_ok(url):
-    try:
-        h = requests.head(url, allow_redirects=True, timeout=20)
-        return 200 <= h.status_code < 400
-    except Exception:
-        return False
+    # HEAD with ranged-GET fallback, cached verdicts (see agent/citations.py)
+    return citations.check_url(url)["ok"]
 
-# ----- Memory (RAG) -----
+# ----- Memory (RAG), persisted under data/chroma; served warm by agent/memd.py if running -----
+CHROMA_PATH = os.getenv("CHROMA_PATH", "data/chroma")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
 _model = None
 _chroma = None
+_mem_lock = threading.Lock()
 def get_embedder():
-    global _model; 
-    if _model is None:
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
+    global _model
+    with _mem_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBED_MODEL)
     return _model
 
 def get_chroma():
     global _chroma
-    if _chroma is None:
-        _chroma = chromadb.Client()
+    with _mem_lock:
+        if _chroma is None:
+            import chromadb
+            os.makedirs(CHROMA_PATH, exist_ok=True)
+            _chroma = chromadb.PersistentClient(path=CHROMA_PATH)
     return _chroma
 
+INDEX_MANIFEST = os.getenv("INDEX_MANIFEST", "data/index_manifest.json")
+INDEX_MAX_PAGES = int(os.getenv("INDEX_MAX_PAGES", "1000"))
+CHUNK_WORDS   = int(os.getenv("CHUNK_WORDS", "200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "40"))
+EMBED_BATCH   = int(os.getenv("EMBED_BATCH", "64"))
+UPSERT_BATCH  = 512
+
+def chunk_text(text, words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    w = text.split()
+    step = max(1, words - overlap)
+    return [" ".join(w[i:i+words]) for i in range(0, max(len(w) - overlap, 1), step) if w[i:i+words]]
+
+def _file_pages(path):
+    # (page, text) units; page 0 for formats without pages
+    if path.lower().endswith(".pdf"):
+        try:
+            for p in pdf.iter_pages(path, max_pages=INDEX_MAX_PAGES):
+                yield p["page"], p["text"]
+        except Exception as e:
+            print(f"[WARN] skipping unreadable PDF {path}: {e}")
+    elif path.lower().endswith((".txt", ".md")):
+        with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+            yield 0, fh.read()
+    # (optional) add docx handling
+
+def _load_manifest():
+    try:
+        with open(INDEX_MANIFEST, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    os.makedirs(os.path.dirname(INDEX_MANIFEST) or ".", exist_ok=True)
+    tmp = INDEX_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp, INDEX_MANIFEST)
+
+@trace.traced("index_folder")
 def index_folder(folder="data/user_docs"):
+    res = memd.call("index", folder=os.path.abspath(folder))
+    return res if res is not None else index_folder_local(folder)
+
+def index_folder_local(folder="data/user_docs"):
+    """
+    Incrementally index .pdf/.txt/.md files as overlapping chunks (with page
+    numbers for PDFs). Files whose mtime+size, or failing that content hash,
+    match the manifest are skipped; changed files have their old chunks replaced
+    and deleted files are dropped. Chunks are embedded and upserted in batches.
+    """
+    # Absolute paths, like memd's: chunk ids, manifest keys and the sweep below must agree across both modes.
+    folder = os.path.abspath(folder)
     coll = get_chroma().get_or_create_collection("jarvis_mem")
-    embedder = get_embedder()
-    docs = []
+    # A manifest without its index (e.g. a fresh in-memory store) can't be trusted.
+    manifest = _load_manifest() if coll.count() and fts.count() else {}
+    embedder = None
+    batch, pending = [], []
+    stats = {"indexed": 0, "skipped": 0, "removed": 0, "chunks": 0}
+
+    def flush():
+        nonlocal embedder
+        if batch:
+            embedder = embedder or get_embedder()
+            with trace.span("embed", chunks=len(batch)):
+                embs = embedder.encode([b[1] for b in batch], batch_size=EMBED_BATCH).tolist()
+            coll.upsert(ids=[b[0] for b in batch], documents=[b[1] for b in batch],
+                        embeddings=embs, metadatas=[b[2] for b in batch])
+            fts.upsert((b[0], b[2]["path"], b[2]["page"], b[1]) for b in batch)
+            stats["chunks"] += len(batch)
+            batch.clear()
+        for path, entry in pending:
+            manifest[path] = entry
+        pending.clear()
+        _save_manifest(manifest)
+
+    seen = set()
     for root, _, files in os.walk(folder):
         for f in files:
             path = os.path.join(root, f)
-            text = ""
-            if f.lower().endswith(".pdf"):
-                parts = read_pdf(path, max_pages=30)
-                text = "\n\n".join([p["text"] for p in parts])
-            elif f.lower().endswith((".txt", ".md")):
-                with open(path, "r", encoding="utf-8", errors="ignore") as fh:
-                    text = fh.read()
-            # (optional) add docx handling
-            if text.strip():
-                emb = embedder.encode(text).tolist()
-                coll.add(documents=[text], embeddings=[emb], metadatas=[{"path": path}], ids=[path])
-    return "Indexed."
+            if not f.lower().endswith((".pdf", ".txt", ".md")):
+                continue
+            seen.add(path)
+            st = os.stat(path)
+            old = manifest.get(path)
+            if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+                stats["skipped"] += 1
+                continue
+            sha = pdf.file_sha(path)
+            if old and old["sha"] == sha:
+                manifest[path] = dict(old, mtime=st.st_mtime, size=st.st_size)
+                stats["skipped"] += 1
+                continue
+            if old:
+                coll.delete(where={"path": path})
+                fts.delete_path(path)
+            n = 0
+            for page, text in _file_pages(path):
+                for chunk in chunk_text(text):
+                    batch.append((f"{path}#{n}", chunk, {"path": path, "page": page, "chunk": n, "sha": sha}))
+                    n += 1
+            pending.append((path, {"mtime": st.st_mtime, "size": st.st_size, "sha": sha, "chunks": n}))
+            stats["indexed"] += 1
+            if len(batch) >= UPSERT_BATCH:
+                flush()
+
+    prefix = os.path.join(folder, "")
+    # (Relative keys from older runs are never in `seen`: their chunks go and the files are re-added above.)
+    for path in [p for p in manifest if os.path.abspath(p).startswith(prefix) and p not in seen]:
+        coll.delete(where={"path": path})
+        fts.delete_path(path)
+        del manifest[path]
+        stats["removed"] += 1
+    flush()
+    return ("Indexed {indexed} files ({chunks} chunks), skipped {skipped} unchanged, "
+            "removed {removed}.").format(**stats)
 
+@trace.traced("rag_recall")
 def rag_recall(query, k=4):
+    res = memd.call("recall", query=query, k=k)
+    return res if res is not None else rag_recall_local(query, k)
+
+RECALL_CANDIDATES = int(os.getenv("RECALL_CANDIDATES", "20"))   # per retriever, before fusion
+RECALL_CHARS      = int(os.getenv("RECALL_CHARS", "800"))
+RAG_RERANK        = os.getenv("RAG_RERANK", "")   # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+_reranker = None
+
+def get_reranker():
+    global _reranker
+    with _mem_lock:
+        if _reranker is None:
+            from sentence_transformers import CrossEncoder
+            _reranker = CrossEncoder(RAG_RERANK, device="cpu")
+    return _reranker
+
+def rag_recall_local(query, k=4):
+    """
+    Hybrid recall: dense (Chroma) and lexical (FTS5/BM25) candidates fused with
+    reciprocal rank fusion, optionally reranked by a CPU cross-encoder
+    (RAG_RERANK). Returns the best-matching span of each winning chunk.
+    """
     coll = get_chroma().get_or_create_collection("jarvis_mem")
-    emb = get_embedder().encode(query).tolist()
-    res = coll.query(query_embeddings=[emb], n_results=k)
-    items = []
-    for doc, meta in zip(res.get("documents",[[]])[0], res.get("metadatas",[[]])[0]):
-        items.append({"path": meta.get("path"), "text": doc[:1200]})
-    return items
+    n = max(k, RECALL_CANDIDATES)
+    chunks, fused = {}, {}
+    if coll.count():
+        with trace.span("embed", chunks=1):
+            emb = get_embedder().encode(query).tolist()
+        res = coll.query(query_embeddings=[emb], n_results=min(n, coll.count()))
+        for rank, (cid, doc, meta) in enumerate(zip(res.get("ids",[[]])[0], res.get("documents",[[]])[0],
+                                                    res.get("metadatas",[[]])[0])):
+            chunks[cid] = {"path": meta.get("path"), "page": meta.get("page"), "text": doc}
+            fused[cid] = fused.get(cid, 0) + 1 / (60 + rank)
+    for rank, hit in enumerate(fts.search(query, n)):
+        chunks.setdefault(hit["id"], {"path": hit["path"], "page": hit["page"], "text": hit["text"]})
+        fused[hit["id"]] = fused.get(hit["id"], 0) + 1 / (60 + rank)
+
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    if RAG_RERANK and ranked:
+        pool = ranked[:max(k * 3, k)]
+        scores = get_reranker().predict([(query, chunks[c]["text"]) for c in pool])
+        fused = dict(zip(pool, (float(s) for s in scores)))
+        ranked = sorted(pool, key=fused.get, reverse=True)
+
+    return [dict(chunks[c], text=best_span(chunks[c]["text"], query, RECALL_CHARS), score=round(fused[c], 4))
+            for c in ranked[:k]]
 
 # ----- Utility: add [CITE] to naked year claims -----
 def enforce_marks(text):
@@ -121,3 +509,15 @@ def enforce_marks(text):
             line += " [CITE]"
         lines.append(line)
     return "\n".join(lines)
+
+def enforce_marks_stream(chunks):
+    """enforce_marks over a chunk stream; emits whole lines as soon as they complete."""
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        if "\n" in buf:
+            done, buf = buf.rsplit("\n", 1)
+            # Line by line: enforce_marks' splitlines() would drop the empty lines of a "\n\n" chunk.
+            yield "".join(enforce_marks(line) + "\n" for line in done.split("\n"))
+    if buf:
+        yield enforce_marks(buf)
@@ -0,0 +1,231 @@
+"""
+Lightweight tracing: timed spans, counters and LLM throughput.
+
+    with trace.span("fetch_and_clean", url=url) as sp:
+        ...
+        sp.set(cache="miss").add("bytes", len(block))
+
+    @trace.traced("step_4")        # a returned generator is timed until exhausted
+    def step_4(...): ...
+
+Every finished span is appended to TRACE_FILE (JSONL, one object per span).
+TRACE_PORT serves the aggregates as Prometheus text on /metrics, and
+summary() renders them as a table for the end of a run.
+"""
+import os, json, time, types, functools, threading
+from collections import defaultdict, deque
+
+TRACE_FILE = os.getenv("TRACE_FILE", "data/trace.jsonl")   # empty disables the JSONL export
+TRACE_PORT = os.getenv("TRACE_PORT", "")                   # e.g. 9464 for /metrics
+TRACE_SAMPLES = 10000                                      # durations kept per span name for p50/p95
+
+_lock = threading.Lock()
+_local = threading.local()
+_fh = None
+_durations = defaultdict(lambda: deque(maxlen=TRACE_SAMPLES))
+_totals = defaultdict(lambda: [0, 0.0, 0])    # name -> [calls, seconds, errors]
+_counters = defaultdict(float)                # (name, ((label, value), ...)) -> value
+
+# ----- Spans -----
+class Span:
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._done = False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, key, n):
+        self.attrs[key] = self.attrs.get(key, 0) + n
+        return self
+
+    def finish(self, error=None):
+        if self._done:
+            return
+        self._done = True
+        seconds = time.perf_counter() - self._t0
+        failed = error is not None and not isinstance(error, GeneratorExit)
+        rec = {"ts": round(self.start, 3), "span": self.name, "ms": round(seconds * 1000, 2),
+               "thread": threading.current_thread().name, "ok": not failed, **self.attrs}
+        if failed:
+            rec["error"] = f"{type(error).__name__}: {error}"
+        with _lock:
+            _durations[self.name].append(seconds)
+            t = _totals[self.name]
+            t[0] += 1
+            t[1] += seconds
+            t[2] += failed
+            _write(rec)
+
+    def __enter__(self):
+        _push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _pop(self)
+        self.finish(exc)
+
+def _push(sp):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(sp)
+
+def _pop(sp):
+    stack = getattr(_local, "stack", [])
+    if sp in stack:
+        stack.remove(sp)   # not necessarily the top: spans in generators close out of order
+
+class _NoSpan:
+    def set(self, **attrs):
+        return self
+
+    def add(self, key, n):
+        return self
+
+def span(name, **attrs):
+    return Span(name, attrs)
+
+def current():
+    """Innermost open span on this thread (a no-op stand-in if there is none)."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else _NoSpan()
+
+def traced(name, **attrs):
+    """Decorator: time each call; if the call returns a generator, time it until exhausted or closed."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            sp = Span(name, attrs)
+            _push(sp)
+            try:
+                out = fn(*args, **kwargs)
+            except BaseException as e:
+                sp.finish(e)
+                raise
+            finally:
+                _pop(sp)
+            if isinstance(out, types.GeneratorType):
+                return _until_exhausted(out, sp)
+            sp.finish()
+            return out
+        return wrapper
+    return deco
+
+def _until_exhausted(gen, sp):
+    error = None
+    try:
+        yield from gen
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        sp.finish(error)
+
+# ----- Counters -----
+def count(name, value=1, **labels):
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += value
+
+def llm_stats(sp, part):
+    """Record Ollama's final-chunk stats (token counts, nanosecond durations) on `sp` and the counters."""
+    prompt, evals = part.get("prompt_eval_count") or 0, part.get("eval_count") or 0
+    prompt_s, eval_s = (part.get("prompt_eval_duration") or 0) / 1e9, (part.get("eval_duration") or 0) / 1e9
+    sp.set(prompt_tokens=prompt, eval_tokens=evals, load_s=round((part.get("load_duration") or 0) / 1e9, 3),
+           prefill_tok_s=round(prompt / prompt_s, 1) if prompt_s else None,
+           tok_s=round(evals / eval_s, 1) if eval_s else None)
+    count("llm_prompt_tokens", prompt)
+    count("llm_eval_tokens", evals)
+    count("llm_prompt_eval_seconds", prompt_s)
+    count("llm_eval_seconds", eval_s)
+
+# ----- Export -----
+def _write(rec):
+    global _fh
+    if not TRACE_FILE:
+        return
+    if _fh is None:
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        _fh = open(TRACE_FILE, "a", encoding="utf-8")
+    _fh.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+    _fh.flush()
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def prometheus():
+    """All aggregates in the Prometheus text exposition format."""
+    lines = ["# TYPE agent_span_calls_total counter", "# TYPE agent_span_seconds_total counter",
+             "# TYPE agent_span_errors_total counter"]
+    with _lock:
+        totals = {k: list(v) for k, v in _totals.items()}
+        counters = dict(_counters)
+    for name, (calls, seconds, errors) in sorted(totals.items()):
+        lbl = _labels([("span", name)])
+        lines += [f"agent_span_calls_total{lbl} {calls}", f"agent_span_seconds_total{lbl} {seconds:.6f}",
+                  f"agent_span_errors_total{lbl} {errors}"]
+    for metric in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE agent_{metric}_total counter")
+        lines += [f"agent_{metric}_total{_labels(labels)} {value:g}"
+                  for (name, labels), value in sorted(counters.items()) if name == metric]
+    return "\n".join(lines) + "\n"
+
+_server = None
+
+def serve(port=None):
+    """Serve /metrics on `port` (default TRACE_PORT) from a daemon thread; no-op without a port."""
+    global _server
+    port = port or TRACE_PORT
+    if not port or _server is not None:
+        return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus().encode()
+            self.send_response(200 if self.path.startswith("/metrics") else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+
+def summary():
+    """Per-span time table plus LLM throughput, bytes fetched and cache hit rates."""
+    with _lock:
+        rows = [(name, list(_durations[name]), *_totals[name]) for name in _totals]
+        counters = dict(_counters)
+    if not rows:
+        return "[trace] no spans recorded"
+    total = lambda name: sum(v for (n, _), v in counters.items() if n == name)
+    out = [f"{'span':<18} {'calls':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>6}"]
+    for name, durs, calls, seconds, errors in sorted(rows, key=lambda r: -r[3]):
+        durs.sort()
+        p = lambda q: durs[min(len(durs) - 1, round(q * (len(durs) - 1)))] * 1000
+        out.append(f"{name:<18} {calls:>6} {seconds:>9.2f} {p(0.5):>9.1f} {p(0.95):>9.1f} {errors:>6}")
+    prompt, evals = total("llm_prompt_tokens"), total("llm_eval_tokens")
+    prompt_s, eval_s = total("llm_prompt_eval_seconds"), total("llm_eval_seconds")
+    if prompt or evals:
+        prefill = f" ({prompt / prompt_s:,.0f} tok/s prefill)" if prompt_s else ""
+        gen = f" ({evals / eval_s:,.1f} tok/s)" if eval_s else ""
+        out.append(f"LLM: {prompt:,.0f} prompt tokens{prefill}, {evals:,.0f} generated{gen}")
+    fetched = total("fetch_bytes")
+    if fetched:
+        out.append(f"Fetched: {fetched / 2**20:,.2f} MB")
+    hits = defaultdict(lambda: [0, 0])
+    for (name, labels), v in counters.items():
+        if name == "cache_lookups":
+            d = dict(labels)
+            hits[d["kind"]][d["hit"] == "1"] += v
+    if hits:
+        out.append("Cache hits: " + ", ".join(f"{kind} {int(h)}/{int(m + h)}" for kind, (m, h) in sorted(hits.items())))
+    return "\n".join(out)
@@ -0,0 +1,114 @@
+import os, random, threading
+from collections import deque
+
+CONNECT_TIMEOUT  = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT     = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "300"))
+RETRIES          = int(os.getenv("HTTP_RETRIES", "3"))
+BACKOFF          = float(os.getenv("HTTP_BACKOFF", "0.5"))
+RETRY_AFTER_MAX  = float(os.getenv("HTTP_RETRY_AFTER_MAX", "30"))   # longest Retry-After we sleep for
+POOL_HOSTS       = int(os.getenv("HTTP_POOL_HOSTS", "32"))   # hosts kept pooled
+POOL_PER_HOST    = int(os.getenv("HTTP_POOL_PER_HOST", "16"))  # keep-alive sockets per host
+USER_AGENT       = "Mozilla/5.0"
+
+# ----- Shared session (one connection pool per host, reused across threads) -----
+_session = None
+_lock = threading.Lock()
+
+def session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # requests/urllib3 are imported here so importing this module is free.
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                class JitterRetry(Retry):
+                    """Exponential backoff with full jitter, so parallel retries don't stampede."""
+                    def get_backoff_time(self):
+                        base = super().get_backoff_time()
+                        return random.uniform(0, base) if base else 0
+
+                    def get_retry_after(self, response):
+                        # Servers may ask for minutes or hours; cap it so one 429/503 can't stall a worker.
+                        value = super().get_retry_after(response)
+                        return None if value is None else min(value, RETRY_AFTER_MAX)
+
+                retry = JitterRetry(
+                    total=RETRIES, connect=RETRIES, status=RETRIES, read=1,
+                    backoff_factor=BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=None,           # also retry POST (Ollama, Tavily)
+                    respect_retry_after_header=True,
+                    raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_PER_HOST, max_retries=retry)
+                s = requests.Session()
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers["User-Agent"] = USER_AGENT
+                _session = s
+    return _session
+
+class HostLimiter:
+    """Per-host concurrency cap: `with limiter.slot(url): ...` waits for a free slot on that host."""
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def slot(self, url):
+        from urllib.parse import urlsplit
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+class HostQueue:
+    """
+    Per-host concurrency cap that never parks a worker: `run(url, job)` runs
+    job() right away if the host has a free slot, else queues it and returns;
+    each queued job is handed to `submit(fn)` when one of that host's jobs ends.
+    """
+    def __init__(self, per_host, submit):
+        self.per_host = per_host
+        self._submit = submit
+        self._lock = threading.Lock()
+        self._active = {}
+        self._waiting = {}
+
+    def run(self, url, job):
+        from urllib.parse import urlsplit
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if self._active.get(host, 0) >= self.per_host:
+                self._waiting.setdefault(host, deque()).append(job)
+                return
+            self._active[host] = self._active.get(host, 0) + 1
+        self._run(host, job)
+
+    def _run(self, host, job):
+        try:
+            job()
+        finally:
+            with self._lock:
+                waiting = self._waiting.get(host)
+                nxt = waiting.popleft() if waiting else None
+                if nxt is None:
+                    self._active[host] -= 1
+            if nxt is not None:   # the slot passes straight to the next job for this host
+                self._submit(lambda: self._run(host, nxt))
+
+def timeouts(read=None):
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read is None else read)
+
+def get(url, read_timeout=None, **kw):
+    return session().get(url, timeout=timeouts(read_timeout), **kw)
+
+def post(url, read_timeout=None, **kw):
+    return session().post(url, timeout=timeouts(read_timeout), **kw)
+
+def head(url, read_timeout=None, **kw):
+    return session().head(url, timeout=timeouts(read_timeout), **kw)
@@ -1,54 +1,311 @@
-import os, asyncio
+import os, hashlib, queue, shlex, shutil, threading, time
+from collections import deque
 from pathlib import Path
-import edge_tts
-from playsound import playsound
+from . import trace
 
-# --- Optional STT (lazy-loaded so TTS tests don't download models) ---
-import sounddevice as sd
-import numpy as np
+# Audio libraries (edge_tts, playsound, sounddevice, numpy, piper, faster_whisper)
+# are imported inside the functions that need them, so a text-only run never loads them.
 
+# --- Optional STT (lazy-loaded so TTS tests don't download models) ---
 _sr = 16000
 _whisper = None
 
 def record(seconds=5, samplerate=_sr):
+    import sounddevice as sd
     audio = sd.rec(int(seconds*samplerate), samplerate=samplerate, channels=1, dtype='float32')
     sd.wait()
     return audio.flatten()
 
-def transcribe(seconds=5):
+def get_whisper():
     global _whisper
     if _whisper is None:
         from faster_whisper import WhisperModel
         _whisper = WhisperModel("base", compute_type="int8")  # loads only when first used
+    return _whisper
+
+def transcribe(seconds=None, max_seconds=30, on_partial=None):
+    """
+    Speech to text from the microphone. By default listens until the speaker
+    stops (VAD endpointing, see listen()); seconds=N keeps the old fixed window.
+    """
+    if seconds is None:
+        return listen(max_seconds=max_seconds, on_partial=on_partial)
     audio = record(seconds)
-    segments, _ = _whisper.transcribe(audio, language="en")
+    segments, _ = get_whisper().transcribe(audio, language="en")
     return " ".join(seg.text for seg in segments)
 
-# --- TTS that actually plays audio ---
+# --- Streaming STT: ring buffer + VAD endpointing + incremental segment decoding ---
+VAD_FRAME_MS   = 30
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))  # audio kept from before speech onset
+VAD_PAUSE_MS   = int(os.getenv("VAD_PAUSE_MS", "250"))    # short pause: decode the segment so far
+VAD_END_MS     = int(os.getenv("VAD_END_MS", "600"))      # long pause: end of utterance
+VAD_MIN_SEG_MS = int(os.getenv("VAD_MIN_SEG_MS", "1000"))
+VAD_MIN_RMS    = float(os.getenv("VAD_MIN_RMS", "0.01"))
+VAD_RATIO      = float(os.getenv("VAD_RATIO", "3.0"))     # speech = this much louder than the noise floor
+VAD_MAX_NOISE  = float(os.getenv("VAD_MAX_NOISE", "0.02"))  # the noise floor never rises above this
+VAD_NOISE_MS   = 2000                                       # noise floor = quietest frame in this window
+VAD_BACKEND    = os.getenv("VAD_BACKEND", "energy")       # "energy" or "webrtc" (needs webrtcvad)
+
+class _Vad:
+    def __init__(self, samplerate):
+        self.samplerate = samplerate
+        self.levels = deque(maxlen=VAD_NOISE_MS // VAD_FRAME_MS)
+        self.webrtc = None
+        if VAD_BACKEND == "webrtc":
+            import webrtcvad
+            self.webrtc = webrtcvad.Vad(2)
+
+    def is_speech(self, frame):
+        import numpy as np
+        if self.webrtc:
+            pcm = (np.clip(frame, -1, 1) * 32767).astype(np.int16).tobytes()
+            return self.webrtc.is_speech(pcm, self.samplerate)
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        # Minimum statistics: the quietest recent frame is the background, capped so that
+        # audio which starts (or stays) at speech level can't lift the floor above speech.
+        self.levels.append(rms)
+        noise = min(min(self.levels), VAD_MAX_NOISE)
+        return rms > max(VAD_MIN_RMS, noise * VAD_RATIO)
+
+def _frames(blocks, size):
+    # Re-cut arbitrary-size blocks into fixed VAD frames.
+    import numpy as np
+    buf = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        buf = np.concatenate([buf, np.asarray(block, dtype=np.float32).reshape(-1)])
+        while len(buf) >= size:
+            yield buf[:size]
+            buf = buf[size:]
+
+def transcribe_stream(blocks, samplerate=_sr, on_partial=None):
+    """
+    Transcribe one utterance from an iterator of float32 audio blocks (any size).
+    Capture stops at the endpoint (VAD_END_MS of silence after speech). Each
+    segment closed by a short pause is decoded on a worker thread while the
+    speaker carries on, so only the last segment is left to decode at the end.
+    on_partial(text_so_far) is called as segments are decoded.
+    """
+    import numpy as np
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    model = get_whisper()
+    size = samplerate * VAD_FRAME_MS // 1000
+    vad = _Vad(samplerate)
+    preroll = deque(maxlen=max(1, VAD_PREROLL_MS // VAD_FRAME_MS))
+    texts = []
+
+    def decode(audio):
+        segments, _ = model.transcribe(audio, language="en", initial_prompt=" ".join(texts) or None,
+                                       condition_on_previous_text=False)
+        texts.append(" ".join(seg.text.strip() for seg in segments).strip())
+        if on_partial:
+            on_partial(" ".join(t for t in texts if t))
+
+    decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt")
+    seg, voiced, started, silent = [], False, False, 0
+    for frame in _frames(blocks, size):
+        speech = vad.is_speech(frame)
+        if not started:
+            preroll.append(frame)
+            if speech:
+                started, seg, voiced, silent = True, list(preroll), True, 0
+            continue
+        seg.append(frame)
+        voiced = voiced or speech
+        silent = 0 if speech else silent + VAD_FRAME_MS
+        if silent >= VAD_END_MS:
+            break
+        if silent >= VAD_PAUSE_MS and voiced and len(seg) * VAD_FRAME_MS >= VAD_MIN_SEG_MS:
+            decoder.submit(decode, np.concatenate(seg))
+            seg, voiced = [], False
+    if started and voiced:
+        decoder.submit(decode, np.concatenate(seg))
+    decoder.shutdown(wait=True)
+    return " ".join(t for t in texts if t)
+
+def listen(max_seconds=30, samplerate=_sr, on_partial=None):
+    """Capture from the microphone until the speaker stops, decoding as they talk."""
+    import sounddevice as sd
+    ring = queue.Queue(maxsize=max(1, int(max_seconds * 1000 // VAD_FRAME_MS)))
+
+    def callback(indata, frames, t, status):
+        try:
+            ring.put_nowait(indata[:, 0].copy())
+        except queue.Full:   # consumer fell behind: drop the oldest block
+            try:
+                ring.get_nowait()
+            except queue.Empty:
+                pass
+            ring.put_nowait(indata[:, 0].copy())
+
+    def blocks():
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            try:
+                yield ring.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    with sd.InputStream(samplerate=samplerate, channels=1, dtype="float32",
+                        blocksize=samplerate * VAD_FRAME_MS // 1000, callback=callback):
+        return transcribe_stream(blocks(), samplerate, on_partial)
+
+def transcribe_array(audio, samplerate=_sr, realtime=False, on_partial=None):
+    """Offline path (no microphone): feed an array through the streaming decoder, optionally at real-time pace."""
+    import numpy as np
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    size = samplerate * VAD_FRAME_MS // 1000
+
+    def blocks():
+        for i in range(0, len(audio), size):
+            if realtime:
+                time.sleep(VAD_FRAME_MS / 1000)
+            yield audio[i:i + size]
+        # trailing silence so an utterance that runs to the end of the file still endpoints
+        yield np.zeros(samplerate * VAD_END_MS // 1000 + size, dtype=np.float32)
+
+    return transcribe_stream(blocks(), samplerate, on_partial)
+
+def transcribe_file(path, realtime=False, on_partial=None):
+    """Transcribe a 16-bit PCM WAV file through the streaming path (resampled to 16 kHz)."""
+    import wave
+    import numpy as np
+    with wave.open(str(path), "rb") as w:
+        rate, channels = w.getframerate(), w.getnchannels()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    audio = pcm.reshape(-1, channels).mean(axis=1) / 32768.0
+    if rate != _sr:
+        audio = np.interp(np.arange(0, len(audio), rate / _sr), np.arange(len(audio)), audio)
+    return transcribe_array(audio, _sr, realtime, on_partial)
+
+# --- TTS that actually plays audio (background queue + phrase cache) ---
 _CACHE = Path("data/cache")
 _CACHE.mkdir(parents=True, exist_ok=True)
+_TTS_CACHE = _CACHE / "tts"
+DEFAULT_VOICE = "en-US-GuyNeural"
+# Player that accepts mp3 on stdin, for playback while synthesis is still running
+TTS_PLAYER = os.getenv("TTS_PLAYER", "")   # e.g. "ffplay -nodisp -autoexit -loglevel quiet -i pipe:0"
+_PLAYERS = (["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-i", "pipe:0"],
+            ["mpv", "--no-video", "--really-quiet", "-"])
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def phrase_path(text, voice=DEFAULT_VOICE):
+    key = hashlib.sha1(f"{voice}\0{text}".encode("utf-8")).hexdigest()
+    return _TTS_CACHE / f"{key}.mp3"
+
+def _stream_player():
+    if TTS_PLAYER:
+        return shlex.split(TTS_PLAYER)
+    for cmd in _PLAYERS:
+        if shutil.which(cmd[0]):
+            return cmd
+    return None
+
+async def _synthesize(text, voice, outfile, player=None):
+    # Write to a private temp file and rename, so concurrent phrases never clobber each other.
+    import subprocess, edge_tts
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    tmp = outfile.with_suffix(f".{os.getpid()}.{threading.get_ident()}.part")
+    proc = subprocess.Popen(player, stdin=subprocess.PIPE) if player else None
+    try:
+        with open(tmp, "wb") as fh:
+            async for chunk in edge_tts.Communicate(text, voice=voice).stream():
+                if chunk["type"] != "audio":
+                    continue
+                fh.write(chunk["data"])
+                if proc:
+                    proc.stdin.write(chunk["data"])   # playback starts with the first chunk
+        os.replace(tmp, outfile)
+    finally:
+        if proc:
+            proc.stdin.close()
+            proc.wait()
+        if tmp.exists():
+            tmp.unlink()
 
-async def speak(text: str, voice: str = "en-US-GuyNeural", outfile: str = None):
+def _play(path):
+    player = _stream_player()
+    if player:
+        import subprocess
+        with open(path, "rb") as fh:
+            subprocess.run(player, stdin=fh)
+    else:
+        from playsound import playsound
+        playsound(str(path))
+
+@trace.traced("speak")
+def _speak_now(text, voice, outfile=None):
+    cached = phrase_path(text, voice)
+    trace.current().set(chars=len(text), cached=cached.exists())
+    if cached.exists():
+        if outfile:
+            shutil.copyfile(cached, outfile)
+        _play(cached)
+        return
+    import asyncio
+    player = _stream_player()
+    asyncio.run(_synthesize(text, voice, cached, player))
+    if outfile:
+        shutil.copyfile(cached, outfile)
+    if not player:
+        _play(cached)
+
+def _run_queue():
+    while True:
+        text, voice, outfile, done = _queue.get()
+        try:
+            _speak_now(text, voice, outfile)
+        except Exception as e:
+            print(f"[WARN] speech failed: {e}")
+        finally:
+            done.set()
+            _queue.task_done()
+
+def say(text, voice=DEFAULT_VOICE, outfile=None):
     """
-    Generate speech with Edge TTS, save to an mp3, and play it.
+    Queue `text` for speech and return at once; phrases play one after another
+    on a background thread. Returns a threading.Event set when playback ends.
+    Phrases are cached per (text, voice), so repeated status lines are
+    synthesized once.
     """
-    if not outfile:
-        outfile = _CACHE / "tts_output.mp3"
-    else:
-        outfile = Path(outfile)
-        outfile.parent.mkdir(parents=True, exist_ok=True)
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_queue, name="tts", daemon=True)
+            _worker.start()
+    done = threading.Event()
+    _queue.put((text, voice, Path(outfile) if outfile else None, done))
+    return done
+
+def drain(timeout=None):
+    """Wait until everything queued with say() has been spoken (or timeout seconds pass)."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
 
-    tts = edge_tts.Communicate(text, voice=voice)
-    await tts.save(str(outfile))          # write mp3
-    playsound(str(outfile))               # play it blocking
+async def speak(text: str, voice: str = DEFAULT_VOICE, outfile: str = None, wait: bool = True):
+    """
+    Generate speech with Edge TTS and play it via the background queue.
+    wait=False returns as soon as the phrase is queued.
+    """
+    import asyncio
+    done = say(text, voice, outfile)
+    if wait:
+        await asyncio.to_thread(done.wait)
 
 # Offline alternative:
-from piper import PiperVoice
 _voice = None
 
 def speak_offline(text, model_path="en_US-amy-low.onnx", out="data/cache/tts_piper.wav"):
     global _voice
     if _voice is None:
+        from piper import PiperVoice
         _voice = PiperVoice.load(model_path)   # download model once and keep locally
     audio = _voice.synthesize(text)            # returns 16kHz PCM
     from scipy.io.wavfile import write
@@ -1,5 +1,7 @@
 import os, json, re
-from .tools import llm_chat, enforce_marks
+from . import trace
+from .context import CONTEXT_TOKENS, pack, pack_results
+from .tools import llm_chat, llm_stream, enforce_marks, enforce_marks_stream, model_for
 
 POLICY = open("policy.txt", "r", encoding="utf-8").read()
 
@@ -13,36 +15,39 @@ FIRST_MESSAGE = """To begin, please provide:
 7) Any required sources or datasets
 """
 
-def step_1_2_3(user_brief):
-    msgs = [
+def _messages(user_brief, task):
+    # Every step starts with the same POLICY + brief messages, byte for byte, so
+    # Ollama (kept loaded via keep_alive) reuses their KV cache instead of
+    # prefilling them again; only the step's task message is new.
+    return [
         {"role":"system","content":POLICY},
-        {"role":"user","content":f"User brief:\n{user_brief}\n\nProduce sections (1)-(2)-(3) only: refined question & scope, outline, and targeted search queries & databases."}
+        {"role":"user","content":f"User brief:\n{user_brief}"},
+        {"role":"user","content":task}
     ]
-    return llm_chat(msgs)
 
-def step_4(user_brief, compact_results_json):
-    msgs = [
-        {"role":"system","content":POLICY},
-        {"role":"user","content":f"""User brief:
-{user_brief}
+def _run(msgs, stream=False, stop=None, model=None):
+    # stream=True returns a generator of text chunks instead of the full reply
+    return llm_stream(msgs, stop=stop, model=model) if stream else llm_chat(msgs, model=model)
+
+@trace.traced("step_1_2_3")
+def step_1_2_3(user_brief, stream=False, stop=None):
+    msgs = _messages(user_brief, "Produce sections (1)-(2)-(3) only: refined question & scope, outline, and targeted search queries & databases.")
+    return _run(msgs, stream, stop, model_for("step_1_2_3"))
 
-Summarize credible sources with links/DOIs (Section 4).
+@trace.traced("step_4")
+def step_4(user_brief, compact_results_json, stream=False):
+    msgs = _messages(user_brief, f"""Summarize credible sources with links/DOIs (Section 4).
 Use only what appears in the provided results—no fabrication.
 If unsure, mark [VERIFY].
 
 Results:
-{compact_results_json[:120000]}
-"""}
-    ]
-    return llm_chat(msgs)
-
-def step_5_6_7(user_brief, outline_text, source_summaries):
-    msgs = [
-        {"role":"system","content":POLICY},
-        {"role":"user","content":f"""User brief:
-{user_brief}
+{compact_results_json}
+""")
+    return _run(msgs, stream, model=model_for("step_4"))
 
-Draft Sections (5) Draft sections with in-text citations, (6) Provisional bibliography, and (7) Limitations & Next Checks.
+@trace.traced("step_5_6_7")
+def step_5_6_7(user_brief, outline_text, source_summaries, stream=False):
+    msgs = _messages(user_brief, f"""Draft Sections (5) Draft sections with in-text citations, (6) Provisional bibliography, and (7) Limitations & Next Checks.
 Rules:
 - Insert in-text citations only if a URL/DOI is present in the summaries.
 - Quote ≤40 words with quotation marks and page numbers if available; otherwise paraphrase with attribution.
@@ -53,6 +58,131 @@ Outline:
 
 Source summaries:
 {source_summaries}
-"""}
-    ]
-    return enforce_marks(llm_chat(msgs))
+""")
+    model = model_for("step_5_6_7")
+    if stream:
+        return enforce_marks_stream(llm_stream(msgs, model=model))
+    return enforce_marks(llm_chat(msgs, model=model))
+
+# ----- Section-level (5)-(7), see agent/draft.py -----
+def section_messages(user_brief, heading, notes, sources):
+    return _messages(user_brief, f"""Draft one section of Section (5): "{heading}".
+Rules:
+- Write only this section's prose: no heading, no other sections.
+- Insert in-text citations only if a URL/DOI is present in the sources below.
+- Quote ≤40 words with quotation marks and page numbers if available; otherwise paraphrase with attribution.
+- Mark uncertain claims [VERIFY] and missing references [CITE].
+- End with a line "References:" and one full reference per line, with its URL/DOI, for each source you cited.
+
+Outline points for this section:
+{notes or "(none)"}
+
+Sources:
+{sources or "(none matched this section; mark claims that need one [CITE])"}
+""")
+
+def limitations_messages(user_brief, headings, source_summaries):
+    outline = "\n".join(f"- {h}" for h in headings)
+    return _messages(user_brief, f"""Write Section (7) Limitations & Next Checks only, in at most 150 words.
+Cover gaps in the sources, evidence that is weak or marked [VERIFY], and concrete next checks.
+
+Draft sections:
+{outline}
+
+Source summaries:
+{source_summaries}
+""")
+
+# ----- Map/reduce Section 4 (one call per source, then one merge) -----
+MAP_EXCERPT = int(os.getenv("MAP_EXCERPT", "6000"))
+
+@trace.traced("summarize_source")
+def summarize_source(user_brief, record):
+    msgs = _messages(user_brief, f"""Summarize this single source for Section 4 in at most 120 words: what it is, its key findings relevant to the brief, and its link/DOI.
+Use only what appears in the text—no fabrication. If unsure, mark [VERIFY]. If it is irrelevant or unreadable, reply IRRELEVANT.
+
+Title: {record.get("title") or ""}
+URL: {record.get("url") or ""}
+Text:
+{(record.get("text") or record.get("snippet") or "")[:MAP_EXCERPT]}
+""")
+    return llm_chat(msgs, model=model_for("summarize_source"))
+
+@trace.traced("reduce_summaries")
+def reduce_summaries(user_brief, source_notes, stream=False, budget=CONTEXT_TOKENS):
+    # source_notes: list of per-source notes; the most relevant distinct ones that fit the budget are kept
+    render = lambda sel: "\n\n".join(p for ps in sel.values() for p in ps)
+    source_summaries = render(pack(list(enumerate(source_notes)), user_brief, budget, render, passage_words=None))
+    msgs = _messages(user_brief, f"""Merge these per-source notes into Section 4: summarize credible sources with links/DOIs.
+Group related sources, drop duplicates, keep every link exactly as given—no fabrication.
+If unsure, mark [VERIFY].
+
+Per-source notes:
+{source_summaries}
+""")
+    return _run(msgs, stream, model=model_for("reduce_summaries"))
+
+# ----- Parsing helpers -----
+def compactify(results, brief="", budget=CONTEXT_TOKENS, limit=20):
+    # Token-budgeted, relevance-ranked, de-duplicated excerpts (see agent/context.py)
+    return pack_results(results, brief, budget=budget, limit=limit)
+
+def _query_line(line):
+    line = line.strip(" \t•*-–")
+    if not line:
+        return None
+    # strip list numbers like "1. " or "2) "
+    line = re.sub(r"^\d+[\.\)]\s*", "", line)
+    # treat likely query lines
+    if any(tok in line for tok in [" AND ", " OR ", "\"", "carbon", "emission", "pricing", "regulation", "OECD"]):
+        if len(line.split()) >= 3 and not line.lower().startswith(("academic databases", "search queries")):
+            return re.sub(r"\s+", " ", line).strip()
+    return None
+
+def extract_queries(outline_text, max_q=8):
+    # Prefer a “Targeted Search Queries” block if present
+    block = outline_text
+    # (blank lines right after the heading don't end the block; same rule as stream_queries)
+    m = re.search(r"(Targeted Search Queries[^\n]*\n\s*.*?)(?:\n\n|\Z)", outline_text, flags=re.I | re.S)
+    if m:
+        block = m.group(1)
+
+    candidates = [q for q in map(_query_line, block.splitlines()) if q]
+
+    # Fallback: catch markdown bullets if nothing found
+    if not candidates:
+        candidates = [m.group(1).strip() for m in re.finditer(r"^[\-\*]\s+(.*)$", outline_text, flags=re.M)]
+
+    # unique + cap
+    seen, out = set(), []
+    for q in candidates:
+        q = re.sub(r"\s+", " ", q).strip()
+        if q and q.lower() not in seen:
+            out.append(q)
+            seen.add(q.lower())
+        if len(out) >= max_q:
+            break
+    return out
+
+def stream_queries(chunks, on_query, max_q=8):
+    """
+    Pass outline chunks through unchanged, calling on_query(q) for each query
+    line of the “Targeted Search Queries” block as soon as the line is complete,
+    so searches start while the model is still writing.
+    """
+    buf, in_block, seen = "", False, set()
+    for chunk in chunks:
+        yield chunk
+        buf += chunk
+        while "\n" in buf and len(seen) < max_q:
+            line, buf = buf.split("\n", 1)
+            if not in_block:
+                in_block = re.search(r"Targeted Search Queries", line, flags=re.I) is not None
+                continue
+            if not line.strip():
+                in_block = not seen   # blank lines before the first query don't end the block
+                continue
+            q = _query_line(line)
+            if q and q.lower() not in seen:
+                seen.add(q.lower())
+                on_query(q)
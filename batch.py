@@ -0,0 +1,111 @@
+"""
+Batch mode: run many briefs through the workflow unattended.
+
+    python batch.py briefs/                 # every .txt/.md file is one brief, .jsonl lines are briefs
+    python batch.py a.jsonl b.txt --workers 3 --out data/runs
+
+Each brief gets data/runs/<id>/ with a checkpoint per step (outline.md,
+research_pack.json, summaries.md, draft.md) plus result.json when finished.
+Re-running the same command skips finished briefs and resumes the others at
+their last completed step. All jobs share one process, so the fetch/verdict
+caches, the embedder and the pooled Ollama connection are shared too.
+
+After editing a brief's outline.md or summaries.md, --redraft re-runs it from
+its checkpoints: only the draft sections whose heading or sources changed
+are rewritten.
+"""
+import argparse, json, os, re, sys, time, traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent import search, trace
+from agent.pipeline import Checkpoint, run_brief
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", text).strip("-")[:80] or "brief"
+
+def load_briefs(paths):
+    """Yield (job_id, brief) from .txt/.md files, .jsonl files ({"id", "brief"} per line) and folders of them."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files += [os.path.join(root, n) for n in sorted(names)]
+        else:
+            files.append(p)
+    for path in files:
+        stem = _slug(os.path.splitext(os.path.basename(path))[0])
+        if path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as fh:
+                for n, line in enumerate(fh, 1):
+                    if not line.strip():
+                        continue
+                    obj = json.loads(line)
+                    brief = obj.get("brief") or obj.get("text") or ""
+                    if brief.strip():
+                        yield _slug(str(obj.get("id") or f"{stem}-{n}")), brief.strip()
+        elif path.endswith((".txt", ".md")):
+            with open(path, "r", encoding="utf-8") as fh:
+                brief = fh.read().strip()
+            if brief:
+                yield stem, brief
+
+def run_job(job_id, brief, out_dir, pipelined=True):
+    root = os.path.join(out_dir, job_id)
+    t0 = time.time()
+    res = run_brief(brief, pipelined=pipelined, checkpoint=Checkpoint(root),
+                    out=lambda *a, **k: None)
+    result = {"id": job_id, "seconds": round(time.time() - t0, 1), "queries": res["queries"],
+              "sources": len(res["research_pack"]), "flagged": res["flagged"],
+              "summaries": res["summaries"], "draft": res["draft"]}
+    with open(os.path.join(root, "result.json"), "w", encoding="utf-8") as fh:
+        json.dump(result, fh, ensure_ascii=False, indent=2)
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+")
+    ap.add_argument("--out", default="data/runs")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "2")))
+    ap.add_argument("--force", action="store_true", help="re-run briefs that already have result.json")
+    ap.add_argument("--redraft", action="store_true", help="re-run finished briefs from their checkpoints")
+    ap.add_argument("--no-pipeline", action="store_true", help="use the one-shot step_4 instead of map/reduce")
+    args = ap.parse_args()
+
+    jobs, seen = [], set()
+    for job_id, brief in load_briefs(args.paths):
+        base, n = job_id, 2
+        while job_id in seen:
+            job_id, n = f"{base}-{n}", n + 1
+        seen.add(job_id)
+        if not (args.force or args.redraft) and os.path.exists(os.path.join(args.out, job_id, "result.json")):
+            print(f"[SKIP] {job_id} (already done)")
+            continue
+        if args.force:
+            Checkpoint(os.path.join(args.out, job_id)).clear()
+        jobs.append((job_id, brief))
+    if not jobs:
+        print("Nothing to do.")
+        return 0
+
+    search.warm()   # local search index syncs in the background
+    print(f"[INFO] {len(jobs)} brief(s), {args.workers} worker(s) -> {args.out}")
+    t0, done, failed = time.time(), 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="brief") as pool:
+        futs = {pool.submit(run_job, job_id, brief, args.out, not args.no_pipeline): job_id
+                for job_id, brief in jobs}
+        for fut in as_completed(futs):
+            job_id = futs[fut]
+            try:
+                r = fut.result()
+                done += 1
+                print(f"[DONE] {job_id}: {r['sources']} sources, {len(r['flagged'])} flagged, {r['seconds']}s")
+            except Exception:
+                failed += 1
+                print(f"[FAIL] {job_id} (re-run to resume from its last checkpoint)\n{traceback.format_exc()}")
+    hours = (time.time() - t0) / 3600
+    print(f"\n[INFO] {done} done, {failed} failed in {hours * 60:.1f} min "
+          f"({done / hours if hours else 0:.1f} briefs/hour)")
+    print(trace.summary())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+End-to-end benchmark of the research pipeline against recorded fixtures.
+
+    python bench/pipeline.py                          # all stages, 5 runs each
+    python bench/pipeline.py --llm-latency 0.2 --llm-tps 40 --json data/bench.json
+    python bench/pipeline.py --baseline data/bench.json   # exit 1 if a stage's p50 regressed
+
+Nothing leaves the machine: a local server plays Ollama's /api/chat (with
+configurable first-token latency and tokens/sec) and serves the saved pages in
+bench/fixtures/pages plus a generated multi-page PDF; web_search uses the
+fixture backend (bench/fixtures/search.json). Caches, indexes and the FTS
+database live in a temporary directory, so every invocation starts cold.
+
+Each stage reports samples, p50/p95 latency, throughput and the peak of
+Python allocations during the stage (tracemalloc). Stages that need optional
+dependencies (sentence-transformers/chromadb for indexing and recall,
+readability for the old HTML path) are skipped when those are missing.
+"""
+import argparse, json, os, re, shutil, statistics, sys, tempfile, threading, time, tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+
+# ----- Fixtures -----
+def make_pdf(pages):
+    """Minimal valid PDF, one page per list of text lines (Helvetica, no compression)."""
+    esc = lambda s: s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    n = len(pages)
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>",
+            f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>"]
+    font = 3 + 2 * n
+    for i, lines in enumerate(pages):
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>")
+        body = "BT /F1 10 Tf 13 TL 60 750 Td " + " ".join(f"({esc(l)}) Tj T*" for l in lines) + " ET"
+        objs.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objs.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out, offsets = "%PDF-1.4\n", []
+    for i, o in enumerate(objs):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{o}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+def fixture_pages():
+    folder = os.path.join(FIXTURES, "pages")
+    return {name: open(os.path.join(folder, name), "rb").read() for name in sorted(os.listdir(folder))}
+
+def report_pdf(n_pages, tag=""):
+    """A report-like PDF built from the fixture articles' paragraphs, wrapped to 90 columns."""
+    paras = []
+    for html in fixture_pages().values():
+        paras += [re.sub(r"<[^>]+>", "", p).strip() for p in re.findall(r"<p[^>]*>(.*?)</p>", html.decode(), re.S)]
+    words = " ".join(p for p in paras if len(p) > 80).encode("latin-1", "replace").decode("latin-1").split()
+    pages, pos = [], 0
+    for n in range(n_pages):
+        lines = [f"Carbon Pricing and Emissions: Panel Evidence {tag}".strip(), f"Page {n + 1}", ""]
+        while len(lines) < 52:
+            line = ""
+            while len(line) < 90:
+                line += words[pos % len(words)] + " "
+                pos += 1
+            lines.append(line.strip())
+        pages.append(lines)
+    return make_pdf(pages)
+
+# ----- Fake Ollama + fixture web server -----
+FILLER = ("evidence suggests that carbon pricing reduces emissions modestly while sectoral standards "
+          "and regulation interact with the priced base across OECD economies").split()
+
+def fake_reply(messages, words):
+    task = messages[-1]["content"]
+    urls = list(dict.fromkeys(u.rstrip(".,;:") for u in re.findall(r"https?://[^\s)\]\"'<>]+", task)))
+    filler = lambda n: " ".join(FILLER[i % len(FILLER)] for i in range(n))
+    if "(1)-(2)-(3)" in task:
+        queries = [q for q in json.load(open(os.path.join(FIXTURES, "search.json"))) if q != "*"]
+        return ("(1) Refined question\n" + filler(words // 3) + "\n\n(2) Outline\n- Background\n- Evidence\n- Interactions\n\n"
+                "(3) Targeted Search Queries\n" + "".join(f"{i}. {q}\n" for i, q in enumerate(queries, 1)) +
+                "\nAcademic databases: Scopus, Web of Science, RePEc\n")
+    if "single source" in task:
+        title = re.search(r"Title: (.*)", task)
+        return f"{title.group(1) if title else 'Source'} ({urls[0] if urls else 'no link'}): " + filler(min(words, 110))
+    per = max(20, words // max(1, len(urls)))
+    return "\n\n".join(f"{filler(per)} ({u})." for u in urls) if urls else filler(words)
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, tps=0.0, words=250, pdf_pages=40):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency, self.tps, self.words = latency, tps, words
+        self.pages = fixture_pages()
+        self.pdf = report_pdf(pdf_pages)
+        self.base = f"http://127.0.0.1:{self.server_address[1]}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/pages/") and path[7:] in self.server.pages:
+            return self.server.pages[path[7:]], "text/html; charset=utf-8"
+        if path.startswith("/pdf/"):
+            return self.server.pdf, "application/pdf"
+        return None, None
+
+    def _send(self, code, body, ctype, head=False):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        body, ctype = self._body()
+        self._send(200 if body else 404, body or b"", ctype or "text/plain", head=True)
+
+    def do_GET(self):
+        body, ctype = self._body()
+        self._send(200 if body else 404, body or b"not found", ctype or "text/plain")
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            return self._send(404, b"not found", "text/plain")
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        t0 = time.perf_counter()
+        reply = fake_reply(req["messages"], self.server.words)
+        tokens = re.findall(r"\S+\s*", reply)
+        time.sleep(self.server.latency)
+        stats = lambda: {"done": True, "eval_count": len(tokens),
+                         "eval_duration": int((time.perf_counter() - t0) * 1e9),
+                         "prompt_eval_count": sum(len(m["content"]) for m in req["messages"]) // 4}
+        if not req.get("stream"):
+            if self.server.tps:
+                time.sleep(len(tokens) / self.server.tps)
+            body = dict(stats(), model=req["model"], message={"role": "assistant", "content": reply})
+            return self._send(200, json.dumps(body).encode(), "application/json")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        def chunk(obj):
+            data = (json.dumps(obj) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        try:
+            for tok in tokens:
+                if self.server.tps:
+                    time.sleep(1 / self.server.tps)
+                chunk({"model": req["model"], "message": {"role": "assistant", "content": tok}, "done": False})
+            chunk(stats())
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True   # client stopped the stream early
+
+# ----- Measurement -----
+class Bench:
+    def __init__(self, trace_memory=True, only=None):
+        self.results = {}
+        self.trace_memory = trace_memory
+        self.only = only
+        if trace_memory:
+            tracemalloc.start()
+
+    def wanted(self, name):
+        return not self.only or name in self.only
+
+    def run(self, name, fn, items, count=None):
+        """Call fn(item) for each item; returns the last result. `count` overrides the throughput numerator."""
+        if not self.wanted(name):
+            return None
+        items = list(items)
+        if self.trace_memory:
+            start_mem = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        lat, out = [], None
+        t0 = time.perf_counter()
+        for item in items:
+            t = time.perf_counter()
+            out = fn(item)
+            lat.append(time.perf_counter() - t)
+        total = time.perf_counter() - t0
+        lat.sort()
+        pct = lambda q: lat[min(len(lat) - 1, round(q * (len(lat) - 1)))]
+        self.results[name] = {
+            "n": len(lat), "p50_ms": round(statistics.median(lat) * 1000, 2), "p95_ms": round(pct(0.95) * 1000, 2),
+            "total_s": round(total, 3), "per_s": round((count or len(lat)) / total, 2) if total else None,
+            "peak_mb": round((tracemalloc.get_traced_memory()[1] - start_mem) / 2**20, 2) if self.trace_memory else None,
+        }
+        print(f"  {name:<22} {self.results[name]['p50_ms']:>9.1f} ms p50")
+        return out
+
+    def skip(self, name, reason):
+        if self.wanted(name):
+            self.results[name] = {"skipped": reason}
+            print(f"  {name:<22} skipped ({reason})")
+
+    def report(self):
+        print(f"\n{'stage':<22} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'total s':>8} {'per s':>8} {'peak MB':>8}")
+        for name, r in self.results.items():
+            if "skipped" in r:
+                print(f"{name:<22} {'-':>4}  skipped: {r['skipped']}")
+                continue
+            peak = "-" if r["peak_mb"] is None else f"{r['peak_mb']:.1f}"
+            print(f"{name:<22} {r['n']:>4} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['total_s']:>8.2f} "
+                  f"{r['per_s'] or 0:>8.1f} {peak:>8}")
+
+def compare(results, baseline, tolerance):
+    """Stages whose p50 grew by more than `tolerance` (and at least 1 ms) over the baseline."""
+    worse = []
+    for name, r in results.items():
+        b = baseline.get(name) or {}
+        if "p50_ms" in r and "p50_ms" in b and r["p50_ms"] > b["p50_ms"] * (1 + tolerance) and r["p50_ms"] - b["p50_ms"] >= 1:
+            worse.append((name, b["p50_ms"], r["p50_ms"]))
+    return worse
+
+# ----- Stages -----
+def run_stages(bench, server, runs, tmp, pdf_pages):
+    from agent import context, draft, research, tools, workflow
+    from agent.pipeline import run_brief
+
+    brief = open(os.path.join(FIXTURES, "brief.txt"), encoding="utf-8").read()
+    outline = fake_reply([{"content": "(1)-(2)-(3)"}], server.words)
+    queries = workflow.extract_queries(outline)
+    urls = [server.base + "/pages/" + name for name in server.pages] + [server.base + "/pdf/report.pdf"]
+
+    print("stages:")
+    bench.run("extract_queries", lambda _: workflow.extract_queries(outline), range(runs * 100))
+    bench.run("step_1_2_3", lambda _: "".join(workflow.step_1_2_3(brief, stream=True)), range(runs))
+    bench.run("web_search", tools.web_search, queries * runs)
+
+    # Cold concurrent search + fetch + clean of every hit, duplicates collapsed.
+    stats = {}
+    def pack(_):
+        with research.ResearchPack(k=6) as p:
+            for q in queries:
+                p.submit(q)
+            records = p.records()
+            stats.update(p.stats)
+            return records
+    records = bench.run("research_pack", pack, range(1)) or pack(0)
+    # The fixtures include a syndicated copy of one page under another URL: expect near_dup >= 1.
+    bench.results.get("research_pack", {}).update(records=len(records), near_dup=stats.get("near_dup"))
+
+    bench.run("fetch_cold", lambda u: tools.fetch_and_clean(u), [f"{u}?bench={i}" for i in range(runs) for u in urls])
+    bench.run("fetch_cached", lambda u: tools.fetch_and_clean(u), urls * runs)
+    html = [b.decode("utf-8") for b in server.pages.values()]
+    bench.run("clean_html[lxml]", lambda h: tools.clean_html(h, "lxml"), html * runs * 5)
+    try:
+        import readability, bs4  # noqa: F401
+        bench.run("clean_html[readability]", lambda h: tools.clean_html(h, "readability"), html * runs * 5)
+    except ImportError as e:
+        bench.skip("clean_html[readability]", e.name)
+
+    compact = bench.run("compactify", lambda _: workflow.compactify(records, brief), range(runs * 5))
+    compact = compact or workflow.compactify(records, brief)
+
+    pdfs = []
+    for i in range(runs):
+        path = os.path.join(tmp, f"report-{i}.pdf")
+        with open(path, "wb") as fh:
+            fh.write(report_pdf(pdf_pages, tag=f"#{i}"))
+        pdfs.append(path)
+    bench.run("read_pdf", lambda p: tools.read_pdf(p, max_pages=None), pdfs, count=runs * pdf_pages)
+
+    docs = os.path.join(tmp, "user_docs")
+    os.makedirs(docs, exist_ok=True)
+    for name, body in server.pages.items():
+        with open(os.path.join(docs, name.replace(".html", ".md")), "w", encoding="utf-8") as fh:
+            fh.write(tools.clean_html(body.decode("utf-8")))
+    shutil.copy(pdfs[0], os.path.join(docs, "report.pdf"))
+    try:
+        import sentence_transformers, chromadb  # noqa: F401
+        bench.run("index_folder", lambda _: tools.index_folder_local(docs), range(1))
+        bench.run("rag_recall", lambda q: tools.rag_recall_local(q, k=4), queries * runs)
+    except ImportError as e:
+        bench.skip("index_folder", e.name)
+        bench.skip("rag_recall", e.name)
+
+    bench.run("summarize_source", lambda r: workflow.summarize_source(brief, r), records * runs)
+    notes = [workflow.summarize_source(brief, r) for r in records]
+    summaries = bench.run("reduce_summaries", lambda _: "".join(workflow.reduce_summaries(brief, notes, stream=True)), range(runs))
+    summaries = summaries or workflow.reduce_summaries(brief, notes)
+    bench.run("step_4", lambda _: "".join(workflow.step_4(brief, compact, stream=True)), range(runs))
+    bench.run("step_5_6_7", lambda _: "".join(workflow.step_5_6_7(brief, outline, summaries, stream=True)), range(runs))
+    # Section-level draft: every unit written in parallel, then again after one outline heading changes.
+    units = draft.plan_units(brief, outline, summaries)
+    bench.run("draft_units", lambda _: "".join(draft.write_units(draft.plan_units(brief, outline, summaries))), range(runs))
+    previous = draft.unit_manifest(units) if "".join(draft.write_units(units)) else None
+    edited = outline.replace("- Evidence", "- Empirical evidence")
+    bench.run("redraft[1 heading]", lambda _: "".join(draft.write_units(draft.plan_units(brief, edited, summaries), previous)), range(runs))
+    bench.run("run_brief", lambda _: run_brief(brief, out=lambda *a, **k: None), range(1))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="seconds before the first token")
+    ap.add_argument("--llm-tps", type=float, default=0, help="generated tokens per second (0 = instant)")
+    ap.add_argument("--llm-words", type=int, default=250, help="approximate reply length")
+    ap.add_argument("--pdf-pages", type=int, default=40)
+    ap.add_argument("--stages", default="", help="comma-separated subset of stages to time")
+    ap.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows Python code down)")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--baseline", help="results JSON of an earlier run to compare p50 against")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--keep", action="store_true", help="keep the temporary data directory")
+    args = ap.parse_args()
+
+    server = FixtureServer(args.llm_latency, args.llm_tps, args.llm_words, args.pdf_pages)
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    fixtures = os.path.join(tmp, "search.json")
+    with open(os.path.join(FIXTURES, "search.json"), encoding="utf-8") as fh:
+        with open(fixtures, "w", encoding="utf-8") as out:
+            out.write(fh.read().replace("{base}", server.base))
+    # Module-level settings are read at import time, so configure before importing agent.
+    os.environ.update({
+        "OLLAMA_URL": server.base, "LLM_CACHE": "0", "MEMD_ADDR": "",
+        "SEARCH_BACKENDS": "fixture", "SEARCH_FIXTURES": fixtures,
+        "CACHE_DB": os.path.join(tmp, "http.sqlite"), "FTS_DB": os.path.join(tmp, "fts.sqlite"),
+        "CHROMA_PATH": os.path.join(tmp, "chroma"), "INDEX_MANIFEST": os.path.join(tmp, "manifest.json"),
+        "USER_DOCS": os.path.join(tmp, "user_docs"), "TRACE_FILE": os.path.join(tmp, "trace.jsonl"),
+    })
+    os.chdir(ROOT)   # policy.txt is read relative to the working directory
+    sys.path.insert(0, ROOT)
+
+    bench = Bench(trace_memory=not args.no_memory, only={s.strip() for s in args.stages.split(",") if s.strip()})
+    try:
+        run_stages(bench, server, args.runs, tmp, args.pdf_pages)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+    bench.report()
+
+    meta = {"runs": args.runs, "llm_latency": args.llm_latency, "llm_tps": args.llm_tps,
+            "llm_words": args.llm_words, "pdf_pages": args.pdf_pages}
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"meta": meta, "stages": bench.results}, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            worse = compare(bench.results, json.load(fh)["stages"], args.tolerance)
+        for name, before, after in worse:
+            print(f"[FAIL] {name}: p50 {before:.1f} ms -> {after:.1f} ms")
+        if worse:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
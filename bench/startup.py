@@ -0,0 +1,57 @@
+"""
+Import-time benchmark for the CLI's cold start.
+
+    python bench/startup.py                  # median of 5 cold imports of main
+    python bench/startup.py --budget-ms 300  # exit 1 if the median exceeds the budget
+
+Each run is a fresh interpreter with -X importtime; the slowest top-level
+imports of the last run are listed so regressions point at their cause.
+"""
+import argparse, os, re, statistics, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_once(module):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+    # -X importtime prints children before their parent: walk back from the module's row
+    end = next(i for i, r in enumerate(rows) if r[2] == module)
+    depth = rows[end][1]
+    start = end
+    while start > 0 and rows[start - 1][1] > depth:
+        start -= 1
+    return rows[end][0] / 1000, [(us, d - depth, name) for us, d, name in rows[start:end]]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="main")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=None)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    times, rows = [], []
+    for _ in range(args.runs):
+        ms, rows = import_once(args.module)
+        times.append(ms)
+    med = statistics.median(times)
+    print(f"import {args.module}: median {med:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms ({args.runs} runs)")
+
+    # Direct children and grandchildren of the module with their cumulative cost
+    print(f"\nslowest imports under {args.module}:")
+    for us, depth, name in sorted((r for r in rows if r[1] <= 4), reverse=True)[:args.top]:
+        print(f"  {us/1000:8.1f} ms  {name}")
+
+    if args.budget_ms is not None and med > args.budget_ms:
+        print(f"\n[FAIL] median {med:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()